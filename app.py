@@ -1,40 +1,47 @@
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, abort, stream_with_context, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from flask_migrate import Migrate
+from sqlalchemy import func, extract, insert, update, tuple_, or_, case, text, inspect, bindparam, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import joinedload, contains_eager
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, timedelta
 import os
-import pandas as pd
-import matplotlib
-matplotlib.use('Agg')  # استخدام واجهة خلفية غير تفاعلية
-import matplotlib.pyplot as plt
-import seaborn as sns
+import re
+import bisect
+import contextlib
+import csv
+import hashlib
 import io
-import base64
-from barcode import Code128
-from barcode.writer import ImageWriter
+import itertools
+import json
+import math
+import multiprocessing
+import shutil
+import tempfile
+import zipfile
+import unicodedata
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import time
+import click
 from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from sklearn.linear_model import LinearRegression
-import numpy as np
-import joblib
+# pandas, NumPy, scikit-learn, matplotlib, ReportLab et python-barcode sont
+# importés dans les fonctions qui s'en servent : un worker ne les charge
+# qu'à la première statistique, facture ou image de code-barres demandée
+os.environ.setdefault('MPLBACKEND', 'Agg')  # استخدام واجهة خلفية غير تفاعلية
 
 app = Flask(__name__)
 # استخدام مفتاح سري من متغيرات البيئة إذا كان متوفراً
 app.secret_key = os.environ.get('SECRET_KEY', 'stock_management_secret_key')
 
-# إعدادات قاعدة البيانات
-# استخدام قاعدة بيانات PostgreSQL على Render أو SQLite محلياً
-database_url = os.environ.get('DATABASE_URL')
-if database_url and database_url.startswith("postgres://"):
-    # تعديل رابط PostgreSQL ليتوافق مع SQLAlchemy
-    database_url = database_url.replace("postgres://", "postgresql://", 1)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url or 'sqlite:///stock.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+# La base est liée à l'application par create_app() (voir wsgi.py)
+db = SQLAlchemy()
+# Schéma versionné par Alembic : dossier migrations/, commandes `flask --app wsgi db ...`
+migrate = Migrate()
 
 # Définition des modèles de base de données
 class Marque(db.Model):
@@ -46,6 +53,15 @@ class Marque(db.Model):
         return f"Marque('{self.nom}')"
 
 class Ecran(db.Model):
+    __table_args__ = (
+        # Index partiel : seuls les écrans en alerte y figurent, la requête des
+        # alertes (interrogée toutes les 30 s par chaque page) n'a rien à filtrer
+        db.Index('ix_ecran_en_alerte', 'id',
+                 sqlite_where=text('quantite <= seuil_alerte'),
+                 postgresql_where=text('quantite <= seuil_alerte')),
+        db.Index('ix_ecran_marque', 'marque_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     barcode = db.Column(db.String(100), unique=True, nullable=False)
     nom = db.Column(db.String(100), nullable=False)
@@ -73,17 +89,43 @@ class Client(db.Model):
         return f"Client('{self.nom}', '{self.prenom}')"
 
 class Vente(db.Model):
+    __table_args__ = (
+        db.Index('ix_vente_date_id', 'date_vente', 'id'),
+        db.Index('ix_vente_ecran_date', 'ecran_id', 'date_vente'),
+        db.Index('ix_vente_client_date', 'client_id', 'date_vente'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     date_vente = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     quantite = db.Column(db.Integer, nullable=False)
     prix_unitaire = db.Column(db.Float, nullable=False)
     ecran_id = db.Column(db.Integer, db.ForeignKey('ecran.id'), nullable=False)
     client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
+    # Ligne d'une facture panier (NULL pour les ventes d'une seule ligne antérieures)
+    facture_id = db.Column(db.Integer, db.ForeignKey('facture.id'), nullable=True, index=True)
 
     def __repr__(self):
         return f"Vente(ID: {self.id}, Date: {self.date_vente}, Quantité: {self.quantite})"
 
+class Facture(db.Model):
+    """En-tête d'une vente panier : un client, une date, N lignes de Vente."""
+    id = db.Column(db.Integer, primary_key=True)
+    date_facture = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
+    total = db.Column(db.Float, nullable=False, default=0)
+    client = db.relationship('Client', backref=db.backref('factures', lazy=True))
+    lignes = db.relationship('Vente', backref='facture', lazy=True, order_by='Vente.id')
+
+    def __repr__(self):
+        return f"Facture(ID: {self.id}, Date: {self.date_facture}, Total: {self.total})"
+
 class Historique(db.Model):
+    __table_args__ = (
+        db.Index('ix_historique_date_id', 'date_operation', 'id'),
+        db.Index('ix_historique_ecran_date', 'ecran_id', 'date_operation'),
+        db.Index('ix_historique_type_date', 'type_operation', 'date_operation'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     date_operation = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     type_operation = db.Column(db.String(50), nullable=False)  # 'ajout' ou 'retrait'
@@ -93,6 +135,180 @@ class Historique(db.Model):
     def __repr__(self):
         return f"Historique('{self.type_operation}', {self.quantite}, {self.date_operation})"
 
+class StockInstantane(db.Model):
+    """Stock d'un écran figé à une date (commande instantane-stock, périodique).
+
+    historique_id est le dernier mouvement d'historique compris dans
+    l'instantané : le stock à une autre date s'en déduit en rejouant les seuls
+    mouvements d'id supérieur.
+    """
+    __table_args__ = (
+        # Un écran par instantané ; sert aussi à trouver l'instantané voisin d'une date
+        db.Index('ix_stock_instantane_date_ecran', 'date_instantane', 'ecran_id', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    date_instantane = db.Column(db.DateTime, nullable=False)
+    historique_id = db.Column(db.Integer, nullable=False)
+    ecran_id = db.Column(db.Integer, db.ForeignKey('ecran.id', ondelete='CASCADE'), nullable=False, index=True)
+    quantite = db.Column(db.Integer, nullable=False)
+    prix_achat = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f"StockInstantane({self.date_instantane}, Écran: {self.ecran_id}, Quantité: {self.quantite})"
+
+class CatalogueJournal(db.Model):
+    """Une ligne par écran, client ou marque ajouté, modifié ou supprimé.
+
+    Remplie par des triggers (installer_journal_catalogue) ; revision croît à
+    chaque modification et sert de curseur au flux /catalogue des caisses
+    (sous PostgreSQL : xid, voir curseur_catalogue).
+    """
+    revision = db.Column(db.Integer, primary_key=True)
+    entite = db.Column(db.String(20), nullable=False)  # nom de la table
+    entite_id = db.Column(db.Integer, nullable=False)
+    xid = db.Column(db.BigInteger, index=True)  # transaction qui a écrit la ligne (PostgreSQL)
+
+    def __repr__(self):
+        return f"CatalogueJournal({self.revision}, {self.entite} {self.entite_id})"
+
+class VenteJournaliere(db.Model):
+    """Cumul des ventes par (jour, écran, marque), maintenu à chaque vente."""
+    __table_args__ = (
+        db.UniqueConstraint('jour', 'ecran_id', 'marque_id', name='uq_vente_journaliere'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    jour = db.Column(db.Date, nullable=False, index=True)
+    ecran_id = db.Column(db.Integer, db.ForeignKey('ecran.id'), nullable=False)
+    marque_id = db.Column(db.Integer, db.ForeignKey('marque.id'), nullable=False)
+    nombre_ventes = db.Column(db.Integer, nullable=False, default=0)
+    quantite = db.Column(db.Integer, nullable=False, default=0)
+    chiffre_affaires = db.Column(db.Float, nullable=False, default=0)
+    cout_achat = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"VenteJournaliere({self.jour}, Écran: {self.ecran_id}, Quantité: {self.quantite})"
+
+# Cumuls journaliers des ventes
+def maj_cumuls_journaliers(date_vente, lignes):
+    """Ajoute les lignes vendues au cumul du jour dans la transaction courante (sans commit).
+
+    `lignes` est une liste de (ecran, quantite, prix_unitaire), un écran au plus
+    une fois (un même INSERT multi-lignes ne peut pas toucher deux fois la même
+    ligne de cumul sous PostgreSQL). Un seul
+    INSERT ... ON CONFLICT DO UPDATE (SQLite >= 3.24 et PostgreSQL) est exécuté
+    pour toutes les lignes, et deux ventes simultanées du même écran ne se
+    marchent pas dessus.
+    """
+    valeurs = [{
+        'jour': date_vente.date(),
+        'ecran_id': ecran.id,
+        'marque_id': ecran.marque_id,
+        'nombre_ventes': 1,
+        'quantite': quantite,
+        'chiffre_affaires': quantite * prix_unitaire,
+        'cout_achat': quantite * ecran.prix_achat
+    } for ecran, quantite, prix_unitaire in lignes]
+    if not valeurs:
+        return
+    dialecte = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    table = VenteJournaliere.__table__
+    stmt = dialecte.insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['jour', 'ecran_id', 'marque_id'],
+        set_={
+            'nombre_ventes': table.c.nombre_ventes + stmt.excluded.nombre_ventes,
+            'quantite': table.c.quantite + stmt.excluded.quantite,
+            'chiffre_affaires': table.c.chiffre_affaires + stmt.excluded.chiffre_affaires,
+            'cout_achat': table.c.cout_achat + stmt.excluded.cout_achat
+        }
+    )
+    db.session.execute(stmt, valeurs)
+
+def reconstruire_cumuls_journaliers():
+    """Recalcule entièrement la table des cumuls à partir de l'historique des ventes."""
+    jour = func.date(Vente.date_vente)
+    agregats = db.session.query(
+        jour,
+        Vente.ecran_id,
+        Ecran.marque_id,
+        func.count(Vente.id),
+        func.sum(Vente.quantite),
+        func.sum(Vente.quantite * Vente.prix_unitaire),
+        func.sum(Vente.quantite * Ecran.prix_achat)
+    ).join(Ecran, Vente.ecran_id == Ecran.id) \
+     .group_by(jour, Vente.ecran_id, Ecran.marque_id)
+
+    table = VenteJournaliere.__table__
+    db.session.execute(table.delete())
+    db.session.execute(table.insert().from_select(
+        ['jour', 'ecran_id', 'marque_id', 'nombre_ventes', 'quantite', 'chiffre_affaires', 'cout_achat'],
+        agregats.statement
+    ))
+    db.session.commit()
+    return VenteJournaliere.query.count()
+
+@app.cli.command('reconstruire-cumuls')
+def reconstruire_cumuls_command():
+    """Reconstruit la table vente_journaliere à partir des ventes existantes."""
+    create_tables()
+    nombre = reconstruire_cumuls_journaliers()
+    print(f"{nombre} cumuls journaliers reconstruits.")
+
+# Cache en mémoire des recherches par barcode (scan en caisse)
+class CacheLRU:
+    """Cache LRU borné avec expiration (TTL), sûr entre threads, avec compteurs."""
+
+    def __init__(self, taille_max=1024, ttl=60):
+        self.taille_max = taille_max
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._donnees = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cle):
+        with self._lock:
+            entree = self._donnees.get(cle)
+            if entree is None or entree[0] < time.monotonic():
+                if entree is not None:
+                    del self._donnees[cle]
+                self.misses += 1
+                return None
+            self._donnees.move_to_end(cle)
+            self.hits += 1
+            return entree[1]
+
+    def set(self, cle, valeur):
+        with self._lock:
+            self._donnees[cle] = (time.monotonic() + self.ttl, valeur)
+            self._donnees.move_to_end(cle)
+            while len(self._donnees) > self.taille_max:
+                self._donnees.popitem(last=False)
+
+    def invalider(self, *cles):
+        with self._lock:
+            for cle in cles:
+                self._donnees.pop(cle, None)
+
+    def vider(self):
+        with self._lock:
+            self._donnees.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'taille': len(self._donnees), 'taille_max': self.taille_max, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses}
+
+# Le TTL borne l'écart entre workers : chaque worker a son propre cache
+app.config.setdefault('BARCODE_CACHE_TAILLE', 4096)
+app.config.setdefault('BARCODE_CACHE_TTL', 30)
+cache_barcode = CacheLRU(
+    taille_max=app.config['BARCODE_CACHE_TAILLE'],
+    ttl=app.config['BARCODE_CACHE_TTL']
+)
+
 # Routes pour l'application
 @app.route('/')
 def index():
@@ -111,6 +327,7 @@ def ajouter_marque():
         nouvelle_marque = Marque(nom=nom)
         db.session.add(nouvelle_marque)
         db.session.commit()
+        invalider_kpi_accueil()
         flash('Marque ajoutée avec succès!', 'success')
     else:
         flash('Le nom de la marque est requis!', 'danger')
@@ -123,6 +340,7 @@ def modifier_marque(id):
     if nom:
         marque.nom = nom
         db.session.commit()
+        cache_barcode.vider()
         flash('Marque modifiée avec succès!', 'success')
     else:
         flash('Le nom de la marque est requis!', 'danger')
@@ -133,15 +351,89 @@ def supprimer_marque(id):
     marque = Marque.query.get_or_404(id)
     db.session.delete(marque)
     db.session.commit()
+    cache_barcode.vider()
+    signaler_changement_stock()
     flash('Marque supprimée avec succès!', 'success')
     return redirect(url_for('marques'))
 
+# Pagination et tri des listes
+LISTE_PAR_PAGE = 50
+LISTE_PAR_PAGE_MAX = 200
+
+def parametres_liste(colonnes, tri_defaut):
+    """Lit tri/ordre/page/par_page de la requête.
+
+    Retourne (tri, ordre, critères ORDER BY, page, par_page). Seules les
+    colonnes listées peuvent servir au tri ; l'id sert de critère secondaire
+    pour un ordre stable d'une page à l'autre.
+    """
+    tri = request.args.get('tri', tri_defaut)
+    if tri not in colonnes:
+        tri = tri_defaut
+    ordre = 'desc' if request.args.get('ordre') == 'desc' else 'asc'
+    colonne = colonnes[tri]
+    criteres = [colonne.desc() if ordre == 'desc' else colonne.asc()]
+    if tri != 'id':
+        criteres.append(colonnes['id'].asc())
+    page = max(request.args.get('page', 1, type=int) or 1, 1)
+    par_page = min(max(request.args.get('par_page', LISTE_PAR_PAGE, type=int) or LISTE_PAR_PAGE, 1), LISTE_PAR_PAGE_MAX)
+    return tri, ordre, criteres, page, par_page
+
+@app.template_global()
+def url_liste(**changements):
+    """URL de la page courante avec les paramètres de requête modifiés (tri, page...)."""
+    arguments = request.args.to_dict()
+    arguments.update(changements)
+    return url_for(request.endpoint, **(request.view_args or {}), **arguments)
+
+def pagination_json(pagination):
+    return {
+        'page': pagination.page,
+        'par_page': pagination.per_page,
+        'total': pagination.total,
+        'pages': pagination.pages
+    }
+
 # Routes pour les écrans
+ECRANS_TRI = {
+    'id': Ecran.id,
+    'barcode': Ecran.barcode,
+    'nom': Ecran.nom,
+    'marque': Marque.nom,
+    'prix_achat': Ecran.prix_achat,
+    'prix_vente': Ecran.prix_vente,
+    'quantite': Ecran.quantite,
+    'seuil_alerte': Ecran.seuil_alerte
+}
+
+def ecran_json(ecran):
+    return {
+        'id': ecran.id,
+        'barcode': ecran.barcode,
+        'nom': ecran.nom,
+        'marque_id': ecran.marque_id,
+        'marque': ecran.marque.nom,
+        'prix_achat': ecran.prix_achat,
+        'prix_vente': ecran.prix_vente,
+        'quantite': ecran.quantite,
+        'seuil_alerte': ecran.seuil_alerte
+    }
+
 @app.route('/ecrans')
 def ecrans():
-    ecrans_list = Ecran.query.all()
-    marques_list = Marque.query.all()
-    return render_template('ecrans.html', ecrans=ecrans_list, marques=marques_list)
+    tri, ordre, criteres, page, par_page = parametres_liste(ECRANS_TRI, 'id')
+    # Jointure sur Marque : tri par marque possible et marque chargée sans requête supplémentaire
+    pagination = Ecran.query.join(Ecran.marque) \
+        .options(contains_eager(Ecran.marque)) \
+        .order_by(*criteres) \
+        .paginate(page=page, per_page=par_page, error_out=False)
+
+    if request.args.get('format') == 'json':
+        return jsonify(dict(pagination_json(pagination), ecrans=[ecran_json(e) for e in pagination.items]))
+
+    marques_list = Marque.query.order_by(Marque.nom).all()
+    return render_template('ecrans.html', ecrans=pagination.items, pagination=pagination,
+                           marques=marques_list, tri=tri, ordre=ordre)
 
 @app.route('/ajouter_ecran', methods=['POST'])
 def ajouter_ecran():
@@ -181,6 +473,8 @@ def ajouter_ecran():
             )
             db.session.add(historique)
             db.session.commit()  # Commit again to save the history
+            cache_barcode.invalider(barcode)
+            signaler_changement_stock()
             flash('Écran ajouté avec succès!', 'success')
         except Exception as e:
             db.session.rollback()
@@ -212,6 +506,8 @@ def modifier_ecran(id):
             flash('Ce barcode existe déjà!', 'danger')
             return redirect(url_for('ecrans'))
 
+        ancien_barcode = ecran.barcode
+
         # Calculer la différence de quantité pour l'historique
         diff_quantite = quantite - ecran.quantite
         type_operation = 'ajout' if diff_quantite > 0 else 'retrait'
@@ -235,6 +531,8 @@ def modifier_ecran(id):
 
         try:
             db.session.commit()
+            cache_barcode.invalider(ancien_barcode, barcode)
+            signaler_changement_stock()
             flash('Écran modifié avec succès!', 'success')
         except Exception as e:
             db.session.rollback()
@@ -246,24 +544,420 @@ def modifier_ecran(id):
 @app.route('/supprimer_ecran/<int:id>')
 def supprimer_ecran(id):
     ecran = Ecran.query.get_or_404(id)
+    barcode = ecran.barcode
     db.session.delete(ecran)
     db.session.commit()
+    cache_barcode.invalider(barcode)
+    signaler_changement_stock()
     flash('Écran supprimé avec succès!', 'success')
     return redirect(url_for('ecrans'))
 
+# Import en masse du catalogue (livraisons fournisseurs)
+app.config.setdefault('IMPORT_LOT', 1000)
+
+IMPORT_COLONNES = ('barcode', 'nom', 'marque', 'prix_achat', 'prix_vente', 'quantite', 'seuil_alerte')
+IMPORT_ALIAS = {
+    'code_barre': 'barcode',
+    'code_barres': 'barcode',
+    'ecran': 'nom',
+    'prix_d_achat': 'prix_achat',
+    'prix_de_vente': 'prix_vente',
+    'seuil_d_alerte': 'seuil_alerte',
+    'seuil': 'seuil_alerte'
+}
+
+def normaliser_entete(entete):
+    """'Prix d'achat' -> 'prix_achat', 'Quantité' -> 'quantite'."""
+    entete = unicodedata.normalize('NFKD', str(entete or '')).encode('ascii', 'ignore').decode()
+    entete = re.sub(r'[^a-z0-9]+', '_', entete.lower()).strip('_')
+    return IMPORT_ALIAS.get(entete, entete)
+
+def lire_lignes_csv(flux):
+    """Itère sur les lignes d'un CSV (séparateur ; ou , détecté) sans tout charger."""
+    texte = io.TextIOWrapper(flux, encoding='utf-8-sig', newline='')
+    debut = texte.readline()
+    separateur = ';' if debut.count(';') > debut.count(',') else ','
+    lecteur = csv.reader(itertools.chain([debut], texte), delimiter=separateur)
+    for valeurs in lecteur:
+        yield valeurs
+
+def lire_lignes_xlsx(flux):
+    """Itère sur les lignes de la première feuille d'un classeur XLSX (lecture seule)."""
+    import openpyxl
+
+    classeur = openpyxl.load_workbook(flux, read_only=True, data_only=True)
+    try:
+        for valeurs in classeur.worksheets[0].iter_rows(values_only=True):
+            yield list(valeurs)
+    finally:
+        classeur.close()
+
+def lire_nombre(valeur, type_nombre):
+    """Nombre d'une cellule : accepte la virgule décimale ; None si vide."""
+    if valeur is None or (isinstance(valeur, str) and not valeur.strip()):
+        return None
+    if isinstance(valeur, str):
+        valeur = valeur.strip().replace('\u00a0', '').replace(' ', '').replace(',', '.')
+    nombre = float(valeur)
+    if type_nombre is int:
+        if not nombre.is_integer():
+            raise ValueError(f"{valeur} n'est pas un entier")
+        return int(nombre)
+    return nombre
+
+def lire_ligne_import(entetes, valeurs):
+    """Convertit une ligne du fichier en dict ; lève ValueError si invalide."""
+    brut = dict(zip(entetes, valeurs))
+    ligne = {}
+    for colonne in ('barcode', 'nom', 'marque'):
+        valeur = brut.get(colonne)
+        if isinstance(valeur, float) and valeur.is_integer():
+            valeur = int(valeur)  # barcode numérique lu depuis Excel
+        valeur = str(valeur).strip() if valeur is not None else ''
+        ligne[colonne] = valeur or None
+    for colonne, type_nombre in (('prix_achat', float), ('prix_vente', float),
+                                 ('quantite', int), ('seuil_alerte', int)):
+        try:
+            ligne[colonne] = lire_nombre(brut.get(colonne), type_nombre)
+        except ValueError:
+            raise ValueError(f"{colonne} invalide: {brut.get(colonne)!r}")
+        if ligne[colonne] is not None and ligne[colonne] < 0:
+            raise ValueError(f"{colonne} négatif: {ligne[colonne]}")
+    if not ligne['barcode']:
+        raise ValueError('barcode manquant')
+    return ligne
+
+def importer_lot(lot, marques, creer_marques, rapport):
+    """Upsert d'un lot de lignes par barcode, historique en masse, un commit.
+
+    `lot` est une liste de (numéro de ligne, dict) ; `marques` associe le nom
+    de marque en minuscules à son id et est complété si `creer_marques`.
+    """
+    # Un barcode présent plusieurs fois dans le lot : quantités cumulées,
+    # dernières valeurs renseignées conservées
+    lignes = {}
+    for numero, ligne in lot:
+        precedente = lignes.get(ligne['barcode'])
+        if precedente:
+            quantite = (precedente[1]['quantite'] or 0) + (ligne['quantite'] or 0)
+            ligne = {**precedente[1], **{k: v for k, v in ligne.items() if v is not None}, 'quantite': quantite}
+        lignes[ligne['barcode']] = (numero, ligne)
+
+    existants = set(db.session.scalars(
+        db.select(Ecran.barcode).where(Ecran.barcode.in_(lignes))
+    ))
+
+    # Les marques créées sont validées tout de suite : le cache `marques`
+    # reste juste même si le lot est rejeté ensuite
+    if creer_marques:
+        nouvelles = {l['marque'].lower(): l['marque'] for _, l in lignes.values()
+                     if l['marque'] and l['marque'].lower() not in marques}
+        if nouvelles:
+            db.session.execute(insert(Marque), [{'nom': nom} for nom in nouvelles.values()])
+            marques.update((nom.lower(), id) for id, nom in db.session.execute(
+                db.select(Marque.id, Marque.nom).where(Marque.nom.in_(nouvelles.values()))
+            ))
+            db.session.commit()
+
+    valeurs = []
+    for barcode, (numero, ligne) in lignes.items():
+        marque_id = None
+        if ligne['marque']:
+            marque_id = marques.get(ligne['marque'].lower())
+            if marque_id is None:
+                rapport['erreurs'].append((numero, f"marque inconnue: {ligne['marque']}"))
+                continue
+        if barcode not in existants:
+            manquants = [c for c in ('nom', 'prix_achat', 'prix_vente') if ligne[c] is None]
+            if marque_id is None:
+                manquants.append('marque')
+            if manquants:
+                rapport['erreurs'].append((numero, f"nouvel écran, champs requis: {', '.join(manquants)}"))
+                continue
+        valeurs.append({
+            'barcode': barcode,
+            'nom': ligne['nom'],
+            'prix_achat': ligne['prix_achat'],
+            'prix_vente': ligne['prix_vente'],
+            'quantite': ligne['quantite'] or 0,
+            'seuil_alerte': ligne['seuil_alerte'] if ligne['seuil_alerte'] is not None
+                            else (None if barcode in existants else 5),
+            'marque_id': marque_id
+        })
+    if not valeurs:
+        db.session.rollback()
+        return
+
+    # Écran existant : la quantité livrée s'ajoute au stock, les champs vides
+    # du fichier conservent la valeur actuelle (un UPDATE exécuté en lot)
+    table = Ecran.__table__
+    mise_a_jour = update(table).where(table.c.barcode == bindparam('b_barcode')).values(
+        quantite=table.c.quantite + bindparam('b_quantite'),
+        **{colonne: func.coalesce(bindparam(f'b_{colonne}'), table.c[colonne])
+           for colonne in ('nom', 'prix_achat', 'prix_vente', 'seuil_alerte', 'marque_id')}
+    )
+    # Nouvel écran : INSERT en lot ; ON CONFLICT couvre un écran créé entre-temps
+    dialecte = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    creation = dialecte.insert(table)
+    creation = creation.on_conflict_do_update(
+        index_elements=['barcode'],
+        set_={'quantite': table.c.quantite + creation.excluded.quantite}
+    )
+    try:
+        a_creer = [v for v in valeurs if v['barcode'] not in existants]
+        a_modifier = [{f'b_{cle}': valeur for cle, valeur in v.items()}
+                      for v in valeurs if v['barcode'] in existants]
+        if a_creer:
+            db.session.execute(creation, a_creer)
+        if a_modifier:
+            db.session.execute(mise_a_jour, a_modifier)
+        barcodes = [v['barcode'] for v in valeurs]
+        ids = dict(db.session.execute(
+            db.select(Ecran.barcode, Ecran.id).where(Ecran.barcode.in_(barcodes))
+        ).all())
+        maintenant = datetime.utcnow()
+        historiques = [{
+            'date_operation': maintenant,
+            'type_operation': 'ajout',
+            'quantite': v['quantite'],
+            'ecran_id': ids[v['barcode']]
+        } for v in valeurs if v['quantite'] > 0]
+        if historiques:
+            db.session.execute(Historique.__table__.insert(), historiques)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        message = f"lot rejeté: {getattr(e, 'orig', e)}"
+        rapport['erreurs'].extend((lignes[v['barcode']][0], message) for v in valeurs)
+        return
+    cache_barcode.invalider(*barcodes)
+    signaler_changement_stock()
+    crees = sum(1 for b in barcodes if b not in existants)
+    rapport['crees'] += crees
+    rapport['mis_a_jour'] += len(barcodes) - crees
+    rapport['unites_ajoutees'] += sum(v['quantite'] for v in valeurs)
+
+def importer_catalogue(flux, nom_fichier, creer_marques=False, taille_lot=None):
+    """Importe un fichier CSV ou XLSX d'écrans par lots, sans le charger en entier.
+
+    Colonnes reconnues : barcode, nom, marque, prix_achat, prix_vente,
+    quantite, seuil_alerte (en-têtes insensibles à la casse et aux accents).
+    Retourne un rapport avec les compteurs et les erreurs par numéro de ligne.
+    """
+    taille_lot = taille_lot or app.config['IMPORT_LOT']
+    debut = time.perf_counter()
+    rapport = {'lignes': 0, 'crees': 0, 'mis_a_jour': 0, 'unites_ajoutees': 0, 'erreurs': []}
+
+    if nom_fichier.lower().endswith(('.xlsx', '.xlsm')):
+        lignes = lire_lignes_xlsx(flux)
+    else:
+        lignes = lire_lignes_csv(flux)
+
+    entetes = [normaliser_entete(e) for e in next(lignes, [])]
+    if 'barcode' not in entetes:
+        rapport['erreurs'].append((1, f"colonne barcode absente (colonnes attendues: {', '.join(IMPORT_COLONNES)})"))
+        return rapport
+
+    marques = {nom.lower(): id for id, nom in db.session.execute(db.select(Marque.id, Marque.nom))}
+    lot = []
+    for numero, valeurs in enumerate(lignes, start=2):
+        if not any(v not in (None, '') for v in valeurs):
+            continue
+        rapport['lignes'] += 1
+        try:
+            lot.append((numero, lire_ligne_import(entetes, valeurs)))
+        except ValueError as e:
+            rapport['erreurs'].append((numero, str(e)))
+        if len(lot) >= taille_lot:
+            importer_lot(lot, marques, creer_marques, rapport)
+            lot = []
+    if lot:
+        importer_lot(lot, marques, creer_marques, rapport)
+
+    rapport['erreurs'].sort()
+    rapport['duree'] = round(time.perf_counter() - debut, 3)
+    return rapport
+
+@app.route('/importer_ecrans', methods=['POST'])
+def importer_ecrans():
+    fichier = request.files.get('fichier')
+    if not fichier or not fichier.filename:
+        flash('Aucun fichier sélectionné!', 'danger')
+        return redirect(url_for('ecrans'))
+
+    rapport = importer_catalogue(fichier.stream, fichier.filename,
+                                 creer_marques=bool(request.form.get('creer_marques')))
+    if request.args.get('format') == 'json':
+        return jsonify({**rapport, 'erreurs': [{'ligne': n, 'message': m} for n, m in rapport['erreurs']]})
+
+    flash(f"Import terminé: {rapport['crees']} écran(s) créé(s), {rapport['mis_a_jour']} mis à jour, "
+          f"{rapport['unites_ajoutees']} unité(s) ajoutée(s) en {rapport['duree']}s.",
+          'success' if not rapport['erreurs'] else 'warning')
+    for numero, message in rapport['erreurs'][:10]:
+        flash(f'Ligne {numero}: {message}', 'danger')
+    if len(rapport['erreurs']) > 10:
+        flash(f"... et {len(rapport['erreurs']) - 10} autre(s) erreur(s).", 'danger')
+    return redirect(url_for('ecrans'))
+
+@app.cli.command('importer-ecrans')
+@click.argument('fichier', type=click.Path(exists=True, dir_okay=False))
+@click.option('--creer-marques', is_flag=True, help='Crée les marques inconnues au lieu de rejeter la ligne.')
+@click.option('--lot', type=int, default=None, help='Nombre de lignes par transaction.')
+def importer_ecrans_command(fichier, creer_marques, lot):
+    """Importe un catalogue CSV/XLSX (upsert par barcode)."""
+    with open(fichier, 'rb') as flux:
+        rapport = importer_catalogue(flux, fichier, creer_marques=creer_marques, taille_lot=lot)
+    for numero, message in rapport['erreurs']:
+        print(f"Ligne {numero}: {message}")
+    print(f"{rapport['lignes']} lignes lues en {rapport['duree']}s: {rapport['crees']} créées, "
+          f"{rapport['mis_a_jour']} mises à jour, {rapport['unites_ajoutees']} unités ajoutées, "
+          f"{len(rapport['erreurs'])} erreur(s).")
+
+# Recherche d'écrans : FTS5 sur SQLite, pg_trgm + unaccent sur PostgreSQL
+RECHERCHE_SQLITE = [
+    # Index plein texte insensible à la casse et aux accents, préfixes indexés
+    """CREATE VIRTUAL TABLE IF NOT EXISTS ecran_fts USING fts5(
+        nom, barcode, marque,
+        tokenize = "unicode61 remove_diacritics 2",
+        prefix = '1 2 3'
+    )""",
+    # Synchronisation par triggers : valable aussi pour les écritures en masse
+    """CREATE TRIGGER IF NOT EXISTS ecran_fts_ai AFTER INSERT ON ecran BEGIN
+        INSERT INTO ecran_fts(rowid, nom, barcode, marque)
+        VALUES (new.id, new.nom, new.barcode, (SELECT nom FROM marque WHERE id = new.marque_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS ecran_fts_ad AFTER DELETE ON ecran BEGIN
+        DELETE FROM ecran_fts WHERE rowid = old.id;
+    END""",
+    # Recréé à chaque démarrage pour que sa définition suive le code ; la clause
+    # WHEN évite de réindexer les écrans dont seuls le stock ou le prix changent
+    # (UPDATE OF se déclenche dès que la colonne est dans le SET, même inchangée)
+    "DROP TRIGGER IF EXISTS ecran_fts_au",
+    """CREATE TRIGGER ecran_fts_au AFTER UPDATE OF nom, barcode, marque_id ON ecran
+    WHEN old.nom IS NOT new.nom OR old.barcode IS NOT new.barcode OR old.marque_id IS NOT new.marque_id
+    BEGIN
+        DELETE FROM ecran_fts WHERE rowid = old.id;
+        INSERT INTO ecran_fts(rowid, nom, barcode, marque)
+        VALUES (new.id, new.nom, new.barcode, (SELECT nom FROM marque WHERE id = new.marque_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS marque_fts_au AFTER UPDATE OF nom ON marque BEGIN
+        UPDATE ecran_fts SET marque = new.nom WHERE rowid IN (SELECT id FROM ecran WHERE marque_id = new.id);
+    END""",
+]
+
+RECHERCHE_POSTGRESQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    # unaccent() n'est pas IMMUTABLE : enveloppe nécessaire pour l'indexer
+    """CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text AS
+        $$ SELECT public.unaccent('public.unaccent', $1) $$
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT""",
+    "CREATE INDEX IF NOT EXISTS ix_ecran_nom_trgm ON ecran USING gin (f_unaccent(lower(nom)) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_ecran_barcode_trgm ON ecran USING gin (lower(barcode) gin_trgm_ops)",
+]
+
+_recherche = {'mode': None}
+
+def installer_recherche():
+    """Crée l'index de recherche adapté à la base (à appeler après les migrations)."""
+    dialecte = db.engine.dialect.name
+    try:
+        if dialecte == 'sqlite':
+            existait = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = 'ecran_fts'")).first()
+            for instruction in RECHERCHE_SQLITE:
+                db.session.execute(text(instruction))
+            if not existait:
+                # Remplissage initial à partir des écrans existants
+                db.session.execute(text(
+                    "INSERT INTO ecran_fts(rowid, nom, barcode, marque) "
+                    "SELECT e.id, e.nom, e.barcode, m.nom FROM ecran e JOIN marque m ON m.id = e.marque_id"))
+        elif dialecte == 'postgresql':
+            for instruction in RECHERCHE_POSTGRESQL:
+                db.session.execute(text(instruction))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Recherche plein texte indisponible, repli sur LIKE: {e}")
+    _recherche['mode'] = None
+
+def mode_recherche():
+    """'fts5', 'trgm' ou 'like' selon ce qui est installé dans la base."""
+    if _recherche['mode'] is None:
+        dialecte = db.engine.dialect.name
+        mode = 'like'
+        if dialecte == 'sqlite':
+            if db.session.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'ecran_fts'")).first():
+                mode = 'fts5'
+        elif dialecte == 'postgresql':
+            if db.session.execute(text("SELECT 1 FROM pg_proc WHERE proname = 'f_unaccent'")).first():
+                mode = 'trgm'
+        _recherche['mode'] = mode
+    return _recherche['mode']
+
+def echapper_like(terme):
+    return terme.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def rechercher_ecrans(terme, limite=20, colonne=None):
+    """Écrans correspondant à terme, les plus pertinents d'abord.
+
+    Chaque mot est cherché en préfixe (autocomplétion), sans tenir compte de
+    la casse ni des accents. colonne peut restreindre à 'nom' ou 'barcode'.
+    """
+    mots = re.findall(r'\w+', terme or '')
+    if not mots:
+        return []
+
+    mode = mode_recherche()
+    if mode == 'fts5':
+        filtre = f'{colonne} : ' if colonne in ('nom', 'barcode') else ''
+        requete_fts = ' '.join(f'{filtre}"{mot}"*' for mot in mots)
+        ids = [ligne[0] for ligne in db.session.execute(
+            text("SELECT rowid FROM ecran_fts WHERE ecran_fts MATCH :q "
+                 "ORDER BY bm25(ecran_fts, 10.0, 5.0, 1.0) LIMIT :limite"),
+            {'q': requete_fts, 'limite': limite})]
+        ecrans = Ecran.query.options(joinedload(Ecran.marque)).filter(Ecran.id.in_(ids)).all() if ids else []
+        rang = {id: i for i, id in enumerate(ids)}
+        return sorted(ecrans, key=lambda e: rang[e.id])
+
+    motif = echapper_like(terme.strip().lower())
+    query = Ecran.query.options(joinedload(Ecran.marque))
+    if mode == 'trgm':
+        nom = func.f_unaccent(func.lower(Ecran.nom))
+        cible = func.f_unaccent(motif)
+        barcode = func.lower(Ecran.barcode)
+        conditions = {
+            'nom': [nom.like(func.concat('%', cible, '%'), escape='\\'), nom.op('%')(cible)],
+            'barcode': [barcode.like(f'{motif}%', escape='\\')]
+        }
+        score = func.greatest(func.similarity(nom, cible), func.similarity(barcode, motif))
+        prefixe = or_(nom.like(func.concat(cible, '%'), escape='\\'), barcode.like(f'{motif}%', escape='\\'))
+    else:
+        conditions = {
+            'nom': [func.lower(Ecran.nom).like(f'%{motif}%', escape='\\')],
+            'barcode': [func.lower(Ecran.barcode).like(f'%{motif}%', escape='\\')]
+        }
+        score = -func.length(Ecran.nom)
+        prefixe = func.lower(Ecran.nom).like(f'{motif}%', escape='\\')
+    if colonne in conditions:
+        retenues = conditions[colonne]
+    else:
+        retenues = conditions['nom'] + conditions['barcode']
+    return query.filter(or_(*retenues)) \
+        .order_by(case((prefixe, 0), else_=1), score.desc(), Ecran.id) \
+        .limit(limite).all()
+
 @app.route('/recherche_ecrans')
 def recherche_ecrans():
     terme = request.args.get('terme', '')
     critere = request.args.get('critere', 'nom')
 
-    if critere == 'nom':
-        ecrans = Ecran.query.filter(Ecran.nom.contains(terme)).all()
-    elif critere == 'barcode':
-        ecrans = Ecran.query.filter(Ecran.barcode.contains(terme)).all()
+    if critere in ('nom', 'barcode'):
+        ecrans = rechercher_ecrans(terme, limite=200, colonne=critere)
     elif critere == 'quantite':
         try:
             quantite = int(terme)
-            ecrans = Ecran.query.filter(Ecran.quantite == quantite).all()
+            ecrans = Ecran.query.options(joinedload(Ecran.marque)).filter(Ecran.quantite == quantite).all()
         except ValueError:
             ecrans = []
     else:
@@ -271,21 +965,177 @@ def recherche_ecrans():
 
     return render_template('recherche_ecrans.html', ecrans=ecrans, terme=terme, critere=critere)
 
+@app.route('/autocompletion_ecrans')
+def autocompletion_ecrans():
+    limite = min(request.args.get('limite', 10, type=int) or 10, 50)
+    ecrans = rechercher_ecrans(request.args.get('q', ''), limite=limite)
+    return jsonify([{
+        'id': e.id,
+        'nom': e.nom,
+        'barcode': e.barcode,
+        'marque': e.marque.nom,
+        'prix_vente': e.prix_vente,
+        'quantite': e.quantite
+    } for e in ecrans])
+
+# Images de codes-barres : le PNG ne dépend que du texte et des options du
+# writer, il est donc mis en cache (LRU en mémoire) et servi comme immuable
+app.config.setdefault('BARCODE_IMAGES_CACHE_TAILLE', 512)
+cache_images_barcode = CacheLRU(taille_max=app.config['BARCODE_IMAGES_CACHE_TAILLE'], ttl=24 * 3600)
+
+def options_barcode():
+    """Options du writer lues de la requête, bornées : (hauteur mm, largeur module mm, texte)."""
+    hauteur = min(max(request.args.get('hauteur', 15.0, type=float), 5.0), 50.0)
+    largeur = min(max(request.args.get('largeur', 0.2, type=float), 0.1), 1.0)
+    texte = request.args.get('texte', '1') != '0'
+    return hauteur, largeur, texte
+
+def image_barcode(barcode, hauteur, largeur, texte):
+    from barcode import Code128
+    from barcode.writer import ImageWriter
+
+    cle = (barcode, hauteur, largeur, texte)
+    png = cache_images_barcode.get(cle)
+    if png is None:
+        rv = BytesIO()
+        with chronometre_rendu('barcode'):
+            Code128(barcode, writer=ImageWriter()).write(rv, options={
+                'module_height': hauteur, 'module_width': largeur, 'write_text': texte
+            })
+        png = rv.getvalue()
+        cache_images_barcode.set(cle, png)
+    return png
+
 @app.route('/generer_barcode/<barcode>')
 def generer_barcode(barcode):
-    # Générer le code-barres
-    rv = BytesIO()
-    Code128(barcode, writer=ImageWriter()).write(rv)
-    rv.seek(0)
+    from barcode.errors import BarcodeError
 
-    # Retourner l'image en base64
-    return send_file(rv, mimetype='image/png')
+    hauteur, largeur, texte = options_barcode()
+    try:
+        png = image_barcode(barcode, hauteur, largeur, texte)
+    except BarcodeError:
+        abort(400, 'Caractères non encodables en Code128.')
+    etag = hashlib.sha1(repr((barcode, hauteur, largeur, texte)).encode()).hexdigest()
+    reponse = send_file(BytesIO(png), mimetype='image/png', etag=etag, conditional=True, max_age=31536000)
+    reponse.cache_control.public = True
+    reponse.cache_control.immutable = True
+    return reponse
+
+# Planches d'étiquettes A4 (format type Avery L7160 : 3 x 7, 63,5 x 38,1 mm)
+app.config.setdefault('ETIQUETTES_COLONNES', 3)
+app.config.setdefault('ETIQUETTES_LIGNES', 7)
+app.config.setdefault('ETIQUETTES_LARGEUR_MM', 63.5)
+app.config.setdefault('ETIQUETTES_HAUTEUR_MM', 38.1)
+app.config.setdefault('ETIQUETTES_MAX', 5000)
+
+def dessiner_etiquettes(p, etiquettes, debut=0):
+    """Place les étiquettes (ecran, nombre de copies) sur des planches A4.
+
+    Le code-barres est dessiné en vectoriel par ReportLab (pas d'image PIL) :
+    quelques centaines d'étiquettes se génèrent en une fraction de seconde.
+    `debut` saute les premières cases d'une planche déjà entamée.
+    """
+    from reportlab.graphics.barcode import code128
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+
+    colonnes, lignes = app.config['ETIQUETTES_COLONNES'], app.config['ETIQUETTES_LIGNES']
+    largeur, hauteur = app.config['ETIQUETTES_LARGEUR_MM'] * mm, app.config['ETIQUETTES_HAUTEUR_MM'] * mm
+    page_largeur, page_hauteur = A4
+    marge_x = (page_largeur - colonnes * largeur) / 2
+    marge_y = (page_hauteur - lignes * hauteur) / 2
+    par_page = colonnes * lignes
+
+    case_numero = debut % par_page
+    for ecran, copies in etiquettes:
+        nom = f"{ecran.marque.nom} - {ecran.nom}"
+        prix = f"{ecran.prix_vente:.2f} TND"
+        symbole = code128.Code128(ecran.barcode, barHeight=12 * mm, barWidth=0.3 * mm, humanReadable=True)
+        if symbole.width > largeur - 4 * mm:
+            # Barcode long : modules plus fins pour tenir dans l'étiquette
+            symbole = code128.Code128(ecran.barcode, barHeight=12 * mm,
+                                      barWidth=0.3 * mm * (largeur - 4 * mm) / symbole.width,
+                                      humanReadable=True)
+        for _ in range(copies):
+            if case_numero == par_page:
+                p.showPage()
+                case_numero = 0
+            colonne, ligne = case_numero % colonnes, case_numero // colonnes
+            x = marge_x + colonne * largeur
+            y = page_hauteur - marge_y - (ligne + 1) * hauteur
+            p.setFont("Helvetica-Bold", 8)
+            p.drawCentredString(x + largeur / 2, y + hauteur - 5 * mm, nom[:40])
+            p.setFont("Helvetica", 8)
+            p.drawCentredString(x + largeur / 2, y + hauteur - 9 * mm, prix)
+            symbole.drawOn(p, x + (largeur - symbole.width) / 2, y + 5 * mm)
+            case_numero += 1
+    p.showPage()
+
+@app.route('/etiquettes', methods=['GET', 'POST'])
+def etiquettes():
+    """Planche PDF d'étiquettes : champs ecran_id/quantite répétés (copies par écran)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    formulaire = request.form if request.method == 'POST' else request.args
+    try:
+        copies = lire_panier(formulaire)
+    except ValueError:
+        abort(400)
+    copies = {ecran_id: nombre for ecran_id, nombre in copies.items() if nombre > 0}
+    if not copies:
+        flash('Aucune étiquette à imprimer!', 'danger')
+        return redirect(url_for('ecrans'))
+    if sum(copies.values()) > app.config['ETIQUETTES_MAX']:
+        abort(413, 'Trop d\'étiquettes pour une seule planche.')
+
+    ecrans = {e.id: e for e in Ecran.query.options(joinedload(Ecran.marque))
+              .filter(Ecran.id.in_(copies)).all()}
+    buffer = BytesIO()
+    with chronometre_rendu('reportlab'):
+        p = canvas.Canvas(buffer, pagesize=A4)
+        dessiner_etiquettes(p, [(ecrans[i], n) for i, n in copies.items() if i in ecrans],
+                            debut=formulaire.get('debut', 0, type=int) or 0)
+        p.save()
+    buffer.seek(0)
+    return send_file(buffer, mimetype='application/pdf', download_name='etiquettes.pdf')
 
 # Routes pour les clients
+CLIENTS_TRI = {
+    'id': Client.id,
+    'nom': Client.nom,
+    'prenom': Client.prenom,
+    'telephone': Client.telephone,
+    'email': Client.email
+}
+
 @app.route('/clients')
 def clients():
-    clients_list = Client.query.all()
-    return render_template('clients.html', clients=clients_list)
+    tri, ordre, criteres, page, par_page = parametres_liste(CLIENTS_TRI, 'id')
+    pagination = Client.query.order_by(*criteres).paginate(page=page, per_page=par_page, error_out=False)
+
+    # Nombre d'achats des clients de la page en une seule requête groupée
+    ids = [client.id for client in pagination.items]
+    nombre_achats = dict(
+        db.session.query(Vente.client_id, func.count(Vente.id))
+        .filter(Vente.client_id.in_(ids))
+        .group_by(Vente.client_id)
+        .all()
+    ) if ids else {}
+
+    if request.args.get('format') == 'json':
+        return jsonify(dict(pagination_json(pagination), clients=[{
+            'id': c.id,
+            'nom': c.nom,
+            'prenom': c.prenom,
+            'telephone': c.telephone,
+            'email': c.email,
+            'adresse': c.adresse,
+            'nombre_achats': nombre_achats.get(c.id, 0)
+        } for c in pagination.items]))
+
+    return render_template('clients.html', clients=pagination.items, pagination=pagination,
+                           nombre_achats=nombre_achats, tri=tri, ordre=ordre)
 
 @app.route('/ajouter_client', methods=['POST'])
 def ajouter_client():
@@ -305,6 +1155,7 @@ def ajouter_client():
         )
         db.session.add(nouveau_client)
         db.session.commit()
+        invalider_kpi_accueil()
         flash('Client ajouté avec succès!', 'success')
     else:
         flash('Le nom et le prénom sont requis!', 'danger')
@@ -336,87 +1187,281 @@ def supprimer_client(id):
     client = Client.query.get_or_404(id)
     db.session.delete(client)
     db.session.commit()
+    invalider_kpi_accueil()
     flash('Client supprimé avec succès!', 'success')
     return redirect(url_for('clients'))
 
+# Catalogue des caisses : la page de vente télécharge une fois écrans, clients
+# et marques (/catalogue), puis seulement les lignes modifiées ou supprimées
+# depuis sa dernière révision. Les triggers journalisent toute écriture, ORM
+# ou en masse (ventes, import), dans catalogue_journal.
+CATALOGUE = {
+    'marques': (Marque, ('id', 'nom')),
+    'ecrans': (Ecran, ('id', 'barcode', 'nom', 'marque_id', 'prix_vente', 'quantite')),
+    'clients': (Client, ('id', 'nom', 'prenom', 'telephone')),
+}
+
+def triggers_journal_catalogue(dialecte):
+    """Instructions qui (re)créent les triggers : leur définition suit CATALOGUE."""
+    instructions = []
+    if dialecte == 'postgresql':
+        instructions.append("""CREATE OR REPLACE FUNCTION catalogue_journaliser() RETURNS trigger AS $$
+        BEGIN
+            -- Aucun verrou : les transactions concurrentes journalisent en
+            -- parallèle, curseur_catalogue tient compte de celles en cours
+            INSERT INTO catalogue_journal(entite, entite_id, xid)
+            VALUES (TG_TABLE_NAME, CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END, txid_current());
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql""")
+    for modele, colonnes in CATALOGUE.values():
+        table = modele.__tablename__
+        suivies = [c for c in colonnes if c != 'id']
+        modifiees = ' OR '.join(f'old.{c} IS DISTINCT FROM new.{c}' if dialecte == 'postgresql'
+                                else f'old.{c} IS NOT new.{c}' for c in suivies)
+        for suffixe, evenement, ligne, condition in (
+                ('ai', 'INSERT', 'new', None),
+                # UPDATE OF se déclenche dès que la colonne est dans le SET, même inchangée
+                ('au', f"UPDATE OF {', '.join(suivies)}", 'new', modifiees),
+                ('ad', 'DELETE', 'old', None)):
+            nom = f'{table}_journal_{suffixe}'
+            quand = f' WHEN ({condition})' if condition else ''
+            if dialecte == 'postgresql':
+                instructions.append(f"DROP TRIGGER IF EXISTS {nom} ON {table}")
+                instructions.append(f"CREATE TRIGGER {nom} AFTER {evenement} ON {table} FOR EACH ROW{quand} "
+                                    f"EXECUTE FUNCTION catalogue_journaliser()")
+            else:
+                instructions.append(f"DROP TRIGGER IF EXISTS {nom}")
+                instructions.append(f"CREATE TRIGGER {nom} AFTER {evenement} ON {table}{quand} BEGIN "
+                                    f"INSERT INTO catalogue_journal(entite, entite_id) VALUES ('{table}', {ligne}.id); END")
+    return instructions
+
+def installer_journal_catalogue():
+    """Crée les triggers du journal du catalogue (à appeler après les migrations)."""
+    for instruction in triggers_journal_catalogue(db.engine.dialect.name):
+        db.session.execute(text(instruction))
+    db.session.commit()
+
+def curseur_catalogue():
+    """(colonne du journal, dernière valeur servie) pour le flux /catalogue.
+
+    SQLite n'a qu'un écrivain à la fois : revision suit l'ordre des commits.
+    Sous PostgreSQL, une révision est attribuée avant le commit et une
+    transaction encore en cours peut en détenir une plus petite que celles déjà
+    visibles. Le curseur y est donc l'identifiant de transaction : ne sont
+    servies que les lignes des transactions terminées, antérieures à la plus
+    ancienne transaction en cours (xmin de l'instantané).
+    """
+    if db.engine.dialect.name == 'postgresql':
+        xmin = db.session.scalar(text('SELECT txid_snapshot_xmin(txid_current_snapshot())'))
+        return CatalogueJournal.xid, xmin - 1
+    return CatalogueJournal.revision, db.session.scalar(
+        db.select(func.coalesce(func.max(CatalogueJournal.revision), 0)))
+
+@app.route('/catalogue')
+def catalogue():
+    """Catalogue des caisses : complet sans ?depuis=<révision>, sinon les seules
+    lignes modifiées (valeurs actuelles) et les id supprimés depuis cette révision."""
+    depuis = request.args.get('depuis', type=int)
+    curseur, revision = curseur_catalogue()
+    # Révision inconnue (base restaurée ou remplacée) : on repart d'un catalogue complet
+    complet = depuis is None or depuis < 0 or depuis > revision
+    reponse = {'revision': revision, 'complet': complet, 'colonnes': {}, 'supprimes': {}}
+    for cle, (modele, colonnes) in CATALOGUE.items():
+        reponse['colonnes'][cle] = colonnes
+        reponse[cle], reponse['supprimes'][cle] = [], []
+        if not complet and depuis == revision:
+            continue
+        requete = db.select(*(getattr(modele, c) for c in colonnes)).order_by(modele.id)
+        if not complet:
+            # Tranche du journal par curseur ; une ligne modifiée après
+            # `revision` est renvoyée avec ses valeurs actuelles, puis de nouveau
+            # au prochain appel : appliquer deux fois la même ligne est sans effet
+            modifies = db.select(CatalogueJournal.entite_id).where(
+                curseur > depuis, curseur <= revision,
+                CatalogueJournal.entite == modele.__tablename__
+            ).distinct()
+            ids = set(db.session.scalars(modifies))
+            if not ids:
+                continue
+            requete = requete.where(modele.id.in_(modifies))
+        reponse[cle] = [list(ligne) for ligne in db.session.execute(requete)]
+        if not complet:
+            reponse['supprimes'][cle] = sorted(ids - {ligne[0] for ligne in reponse[cle]})
+    return jsonify(reponse)
+
+@app.cli.command('compacter-catalogue')
+def compacter_catalogue_command():
+    """Ne garde que la dernière ligne du journal du catalogue par écran, client ou marque."""
+    derniere = db.select(func.max(CatalogueJournal.revision)) \
+        .group_by(CatalogueJournal.entite, CatalogueJournal.entite_id)
+    resultat = db.session.execute(CatalogueJournal.__table__.delete()
+                                  .where(CatalogueJournal.revision.not_in(derniere)))
+    db.session.commit()
+    print(f"{resultat.rowcount} lignes supprimées du journal du catalogue.")
+
 # Routes pour les ventes
 @app.route('/vente')
 def vente():
-    ecrans = Ecran.query.all()
-    clients = Client.query.all()
-    return render_template('vente.html', ecrans=ecrans, clients=clients)
+    # Écrans et clients chargés par la page depuis /catalogue
+    return render_template('vente.html')
 
 @app.route('/recherche_ecran_barcode')
 def recherche_ecran_barcode():
     barcode = request.args.get('barcode', '')
-    ecran = Ecran.query.filter_by(barcode=barcode).first()
-
-    if ecran:
-        return jsonify({
+    donnees = cache_barcode.get(barcode)
+    if donnees is None:
+        ecran = Ecran.query.options(joinedload(Ecran.marque)).filter_by(barcode=barcode).first()
+        if not ecran:
+            return jsonify({'error': 'Écran non trouvé'}), 404
+        donnees = {
             'id': ecran.id,
             'nom': ecran.nom,
             'marque': ecran.marque.nom,
             'prix_vente': ecran.prix_vente,
             'quantite': ecran.quantite
-        })
-    else:
-        return jsonify({'error': 'Écran non trouvé'}), 404
+        }
+        cache_barcode.set(barcode, donnees)
+    return jsonify(donnees)
+
+@app.route('/cache_barcode/stats')
+def cache_barcode_stats():
+    return jsonify(cache_barcode.stats())
+
+def lire_panier(formulaire):
+    """Lit les lignes du panier : champs `ecran_id` et `quantite` répétés.
+
+    Retourne un dict ordonné {ecran_id: quantite}, les lignes d'un même écran
+    étant regroupées. Lève ValueError si une valeur n'est pas un entier.
+    """
+    panier = {}
+    for ecran_id, quantite in zip(formulaire.getlist('ecran_id'), formulaire.getlist('quantite')):
+        if not ecran_id:
+            continue
+        ecran_id, quantite = int(ecran_id), int(quantite)
+        panier[ecran_id] = panier.get(ecran_id, 0) + quantite
+    return panier
 
 @app.route('/effectuer_vente', methods=['POST'])
 def effectuer_vente():
-    ecran_id = int(request.form.get('ecran_id'))
-    client_id = int(request.form.get('client_id'))
-    quantite = int(request.form.get('quantite'))
+    """Vente d'un panier de N lignes en une seule transaction.
 
-    ecran = Ecran.query.get_or_404(ecran_id)
+    Le formulaire répète les champs `ecran_id`/`quantite` pour chaque ligne ;
+    une vente d'une seule ligne reste un panier d'une ligne.
+    """
+    try:
+        panier = lire_panier(request.form)
+        client_id = int(request.form.get('client_id'))
+    except (TypeError, ValueError):
+        abort(400)
     client = Client.query.get_or_404(client_id)
 
-    if ecran.quantite >= quantite:
-        # Mettre à jour la quantité en stock
-        ecran.quantite -= quantite
+    if not panier:
+        flash('Le panier est vide!', 'danger')
+        return redirect(url_for('vente'))
+    if any(quantite <= 0 for quantite in panier.values()):
+        flash('La quantité doit être positive!', 'danger')
+        return redirect(url_for('vente'))
 
-        # Créer la vente
-        nouvelle_vente = Vente(
-            quantite=quantite,
-            prix_unitaire=ecran.prix_vente,
-            ecran_id=ecran.id,
-            client_id=client.id
-        )
+    ecrans = {e.id: e for e in Ecran.query.filter(Ecran.id.in_(panier)).all()}
+    if len(ecrans) != len(panier):
+        abort(404)
+
+    # Décrément atomique de toutes les lignes en un seul UPDATE : la condition
+    # sur le stock est évaluée par la base, deux caisses ne peuvent pas vendre
+    # les mêmes unités. Si une seule ligne manque de stock, rien n'est vendu.
+    besoin = case(panier, value=Ecran.id)
+    resultat = db.session.execute(
+        update(Ecran)
+        .where(Ecran.id.in_(panier), Ecran.quantite >= besoin)
+        .values(quantite=Ecran.quantite - besoin)
+        .execution_options(synchronize_session=False)
+    )
+    if resultat.rowcount != len(panier):
+        db.session.rollback()
+        stocks = dict(db.session.query(Ecran.id, Ecran.quantite).filter(Ecran.id.in_(panier)).all())
+        manquants = ', '.join(f"{ecrans[i].nom} ({stocks.get(i, 0)} en stock)"
+                              for i, quantite in panier.items() if stocks.get(i, 0) < quantite)
+        flash(f'Quantité insuffisante en stock: {manquants}', 'danger')
+        return redirect(url_for('vente'))
 
-        # Ajouter à l'historique
-        historique = Historique(
-            type_operation='retrait',
-            quantite=quantite,
-            ecran_id=ecran.id
-        )
+    # En-tête de facture, puis lignes de vente et historique insérés en lot
+    maintenant = datetime.utcnow()
+    lignes = [(ecrans[i], quantite, ecrans[i].prix_vente) for i, quantite in panier.items()]
+    barcodes = [ecran.barcode for ecran, _, _ in lignes]
+    nouvelle_facture = Facture(
+        date_facture=maintenant,
+        client_id=client.id,
+        total=round(sum(quantite * prix for _, quantite, prix in lignes), 2)
+    )
+    try:
+        db.session.add(nouvelle_facture)
+        db.session.flush()
+        ventes_ids = db.session.scalars(
+            insert(Vente).returning(Vente.id),
+            [{
+                'date_vente': maintenant,
+                'quantite': quantite,
+                'prix_unitaire': prix,
+                'ecran_id': ecran.id,
+                'client_id': client.id,
+                'facture_id': nouvelle_facture.id
+            } for ecran, quantite, prix in lignes]
+        ).all()
 
-        db.session.add(nouvelle_vente)
-        db.session.add(historique)
+        # Ajouter à l'historique
+        db.session.execute(insert(Historique), [{
+            'date_operation': maintenant,
+            'type_operation': 'retrait',
+            'quantite': quantite,
+            'ecran_id': ecran.id
+        } for ecran, quantite, _ in lignes])
+
+        maj_cumuls_journaliers(maintenant, lignes)
         db.session.commit()
-
-        flash('Vente effectuée avec succès!', 'success')
-        return redirect(url_for('facture', vente_id=nouvelle_vente.id))
-    else:
-        flash('Quantité insuffisante en stock!', 'danger')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erreur lors de la vente: {str(e)}', 'danger')
         return redirect(url_for('vente'))
+    cache_barcode.invalider(*barcodes)
+    signaler_changement_stock()
+
+    flash('Vente effectuée avec succès!', 'success')
+    return redirect(url_for('facture', vente_id=min(ventes_ids)))
+
+def lignes_facture(vente):
+    """Lignes de la facture d'une vente : tout le panier, ou la vente seule."""
+    if vente.facture_id is None:
+        return [vente]
+    return Vente.query.options(joinedload(Vente.ecran).joinedload(Ecran.marque)) \
+        .filter(Vente.facture_id == vente.facture_id) \
+        .order_by(Vente.id).all()
 
 @app.route('/facture/<int:vente_id>')
 def facture(vente_id):
     vente = Vente.query.get_or_404(vente_id)
-    return render_template('facture.html', vente=vente)
+    lignes = lignes_facture(vente)
+    total = round(sum(ligne.quantite * ligne.prix_unitaire for ligne in lignes), 2)
+    return render_template('facture.html', vente=vente, numero=numero_facture(vente), lignes=lignes, total=total)
+
+# Factures PDF : rendu unique mis en cache sur disque, lots pour les clôtures
+app.config.setdefault('FACTURES_CACHE_DIR', os.path.join(app.instance_path, 'factures'))
+# Le lot HTTP est rendu dans le worker (~2,5 ms par facture) : au-delà, flask factures-lot
+app.config.setdefault('FACTURES_LOT_MAX', 1000)
+app.config.setdefault('FACTURES_PROCESSUS', max(1, min(4, (os.cpu_count() or 1))))
+# À incrémenter quand la mise en page change : les anciens PDF ne sont plus servis
+FACTURE_PDF_VERSION = 2
+
+def numero_facture(vente):
+    """Numéro affiché : F<id> pour une facture panier, l'id de la vente sinon."""
+    return f"F{vente.facture_id}" if vente.facture_id else str(vente.id)
+
+def dessiner_facture(p, vente, lignes):
+    """Dessine une facture sur le canvas `p` (une ou plusieurs pages)."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
 
-@app.route('/generer_facture_pdf/<int:vente_id>')
-def generer_facture_pdf(vente_id):
-    vente = Vente.query.get_or_404(vente_id)
-    ecran = vente.ecran
-    client = vente.client
-
-    # Créer un buffer pour le PDF
-    buffer = BytesIO()
-
-    # Créer le PDF
-    p = canvas.Canvas(buffer, pagesize=letter)
     width, height = letter
+    client = vente.client
 
     # Ajouter le titre
     p.setFont("Helvetica-Bold", 16)
@@ -425,7 +1470,7 @@ def generer_facture_pdf(vente_id):
     # Ajouter les informations de la vente
     p.setFont("Helvetica", 12)
     p.drawString(inch, height - 1.5 * inch, f"Date: {vente.date_vente.strftime('%d/%m/%Y %H:%M')}")
-    p.drawString(inch, height - 1.75 * inch, f"ID Vente: {vente.id}")
+    p.drawString(inch, height - 1.75 * inch, f"Facture N°: {numero_facture(vente)}")
 
     # Ajouter les informations du client
     p.setFont("Helvetica-Bold", 12)
@@ -437,164 +1482,1084 @@ def generer_facture_pdf(vente_id):
     if client.email:
         p.drawString(inch, height - 3 * inch, f"Email: {client.email}")
 
-    # Ajouter les informations du produit
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(inch, height - 3.5 * inch, "Produit:")
-    p.setFont("Helvetica", 12)
-    p.drawString(inch, height - 3.75 * inch, f"Marque: {ecran.marque.nom}")
-    p.drawString(inch, height - 4 * inch, f"Écran: {ecran.nom}")
-    p.drawString(inch, height - 4.25 * inch, f"Barcode: {ecran.barcode}")
-    p.drawString(inch, height - 4.5 * inch, f"Quantité: {vente.quantite}")
-    p.drawString(inch, height - 4.75 * inch, f"Prix unitaire: {ecran.prix_vente} TND")
+    # Tableau des produits, sur plusieurs pages si le panier est long
+    colonnes = [inch, 2.3 * inch, 4.6 * inch, 5.4 * inch, 6.6 * inch]
+
+    def entete_tableau(y):
+        p.setFont("Helvetica-Bold", 11)
+        for x, titre in zip(colonnes, ("Marque", "Écran", "Qté", "Prix unitaire", "Total")):
+            p.drawString(x, y, titre)
+        p.line(inch, y - 0.08 * inch, width - inch, y - 0.08 * inch)
+        p.setFont("Helvetica", 11)
+        return y - 0.3 * inch
+
+    y = entete_tableau(height - 3.5 * inch)
+    total = 0
+    for ligne in lignes:
+        if y < 1.25 * inch:
+            p.showPage()
+            y = entete_tableau(height - inch)
+        montant = ligne.quantite * ligne.prix_unitaire
+        total += montant
+        valeurs = (ligne.ecran.marque.nom[:18], ligne.ecran.nom[:30], str(ligne.quantite),
+                   f"{ligne.prix_unitaire} TND", f"{round(montant, 2)} TND")
+        for x, valeur in zip(colonnes, valeurs):
+            p.drawString(x, y, valeur)
+        y -= 0.25 * inch
 
     # Calculer le total
-    total = vente.quantite * vente.prix_unitaire
+    if y < 1.25 * inch:
+        p.showPage()
+        y = height - inch
     p.setFont("Helvetica-Bold", 12)
-    p.drawString(inch, height - 5.25 * inch, f"Total: {total} TND")
-
-    # Finaliser le PDF
+    p.drawString(inch, y - 0.25 * inch, f"Total: {round(total, 2)} TND")
     p.showPage()
-    p.save()
 
-    buffer.seek(0)
-    return send_file(buffer, as_attachment=True, download_name=f'facture_{vente.id}.pdf', mimetype='application/pdf')
+def rendre_facture_pdf(vente):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    lignes = lignes_facture(vente)
+    buffer = BytesIO()
+    with chronometre_rendu('reportlab'):
+        p = canvas.Canvas(buffer, pagesize=letter)
+        dessiner_facture(p, vente, lignes)
+        p.save()
+    return buffer.getvalue()
+
+def facture_en_cache(vente):
+    """Chemin du PDF de la facture de `vente`, rendu et écrit sur disque si absent.
+
+    Une facture émise ne change plus : la clé est le numéro de facture (toutes
+    les lignes d'un panier partagent le même fichier) et la version du rendu.
+    """
+    dossier = app.config['FACTURES_CACHE_DIR']
+    chemin = os.path.join(dossier, f'facture-{numero_facture(vente)}-v{FACTURE_PDF_VERSION}.pdf')
+    if os.path.exists(chemin):
+        return chemin
+    pdf = rendre_facture_pdf(vente)
+    os.makedirs(dossier, exist_ok=True)
+    temporaire = f'{chemin}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporaire, 'wb') as f:
+        f.write(pdf)
+    os.replace(temporaire, chemin)
+    return chemin
+
+@app.route('/generer_facture_pdf/<int:vente_id>')
+def generer_facture_pdf(vente_id):
+    vente = Vente.query.get_or_404(vente_id)
+    chemin = facture_en_cache(vente)
+    # ETag fort : le contenu d'une facture donnée ne change jamais
+    return send_file(chemin, as_attachment=True, download_name=f'facture_{numero_facture(vente)}.pdf',
+                     mimetype='application/pdf', conditional=True,
+                     etag=f'facture-{numero_facture(vente)}-v{FACTURE_PDF_VERSION}')
+
+def ventes_a_facturer(du=None, au=None, client_id=None):
+    """Une vente représentative (la première ligne) par facture de la période."""
+    requete = db.select(Vente.id, Vente.facture_id).order_by(Vente.date_vente, Vente.id)
+    if du:
+        requete = requete.where(Vente.date_vente >= du)
+    if au:
+        requete = requete.where(Vente.date_vente < au)
+    if client_id:
+        requete = requete.where(Vente.client_id == client_id)
+    ids, factures = [], set()
+    for vente_id, facture_id in db.session.execute(requete):
+        if facture_id is not None:
+            if facture_id in factures:
+                continue
+            factures.add(facture_id)
+        ids.append(vente_id)
+    return ids
+
+def _initialiser_processus_factures(config):
+    # Processus lancé par spawn : app.py vient d'être importé, sans base liée
+    create_app(config)
+
+def _rendre_factures(ventes_ids):
+    """Exécuté dans un processus du pool : met en cache un paquet de factures."""
+    with app.app_context():
+        ventes = Vente.query.options(joinedload(Vente.client)).filter(Vente.id.in_(ventes_ids)).all()
+        for vente in ventes:
+            facture_en_cache(vente)
+        db.session.remove()
+    return len(ventes)
+
+def preparer_lot_factures(ventes_ids, processus=1):
+    """Rend les factures absentes du cache, avec un pool de processus si processus > 1.
+
+    Le rendu ReportLab est du calcul pur : la commande factures-lot le
+    répartit sur plusieurs processus. Les processus sont lancés par spawn,
+    jamais par fork : un fork depuis un worker web (threads de requêtes, flux
+    SSE, écriture des métriques) pourrait hériter d'un verrou tenu. Retourne
+    les chemins dans l'ordre des ventes.
+    """
+    ventes = Vente.query.filter(Vente.id.in_(ventes_ids)).all() if ventes_ids else []
+    par_id = {v.id: v for v in ventes}
+    chemins = {v.id: os.path.join(app.config['FACTURES_CACHE_DIR'],
+                                  f'facture-{numero_facture(v)}-v{FACTURE_PDF_VERSION}.pdf')
+               for v in ventes}
+    manquantes = [i for i in ventes_ids if i in chemins and not os.path.exists(chemins[i])]
+
+    if len(manquantes) > 1 and processus > 1:
+        db.session.remove()
+        contexte = multiprocessing.get_context('spawn')
+        taille = max(1, -(-len(manquantes) // (processus * 4)))
+        paquets = [manquantes[k:k + taille] for k in range(0, len(manquantes), taille)]
+        with ProcessPoolExecutor(processus, mp_context=contexte,
+                                 initializer=_initialiser_processus_factures,
+                                 initargs=({cle: app.config[cle] for cle in
+                                            ('SQLALCHEMY_DATABASE_URI', 'FACTURES_CACHE_DIR')},)) as pool:
+            list(pool.map(_rendre_factures, paquets))
+    else:
+        for i in manquantes:
+            facture_en_cache(par_id[i])
+    return [chemins[i] for i in ventes_ids if i in chemins]
+
+def assembler_lot_factures(chemins, format):
+    """Fichier temporaire contenant un PDF fusionné ou une archive ZIP."""
+    fichier = tempfile.TemporaryFile()
+    if format == 'zip':
+        with zipfile.ZipFile(fichier, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for chemin in chemins:
+                archive.write(chemin, os.path.basename(chemin))
+    else:
+        from pypdf import PdfWriter
+
+        fusion = PdfWriter()
+        for chemin in chemins:
+            fusion.append(chemin)
+        fusion.write(fichier)
+        fusion.close()
+    fichier.seek(0)
+    return fichier
+
+@app.route('/factures_lot')
+def factures_lot():
+    """Toutes les factures d'une période et/ou d'un client : ?du=&au=&client_id=&format=pdf|zip."""
+    format = 'zip' if request.args.get('format') == 'zip' else 'pdf'
+    du = lire_date(request.args.get('du'))
+    au = lire_date(request.args.get('au'), fin_de_journee=True)
+    client_id = request.args.get('client_id', type=int)
+    if not (du or au or client_id):
+        abort(400, 'Préciser une période (du, au) ou un client.')
+
+    ventes_ids = ventes_a_facturer(du, au, client_id)
+    if not ventes_ids:
+        abort(404)
+    if len(ventes_ids) > app.config['FACTURES_LOT_MAX']:
+        abort(413, 'Trop de factures pour un seul lot : réduire la période '
+                   '(ou utiliser la commande flask factures-lot).')
+
+    fichier = assembler_lot_factures(preparer_lot_factures(ventes_ids), format)
+    periode = '_'.join(request.args.get(cle) for cle in ('du', 'au') if lire_date(request.args.get(cle)))
+    nom = '_'.join(filter(None, ['factures', periode, f'client{client_id}' if client_id else None]))
+    return send_file(fichier, as_attachment=True, download_name=f'{nom}.{format}',
+                     mimetype='application/zip' if format == 'zip' else 'application/pdf')
+
+@app.cli.command('factures-lot')
+@click.argument('sortie', type=click.Path(dir_okay=False, writable=True))
+@click.option('--du', help='Date de début (AAAA-MM-JJ).')
+@click.option('--au', help='Date de fin incluse (AAAA-MM-JJ).')
+@click.option('--client', 'client_id', type=int, help='Id du client.')
+@click.option('--processus', type=int, default=None, help='Taille du pool de rendu.')
+def factures_lot_command(sortie, du, au, client_id, processus):
+    """Écrit les factures de la sélection dans SORTIE (.pdf fusionné ou .zip)."""
+    debut = time.perf_counter()
+    ventes_ids = ventes_a_facturer(lire_date(du), lire_date(au, fin_de_journee=True), client_id)
+    chemins = preparer_lot_factures(ventes_ids, processus or app.config['FACTURES_PROCESSUS'])
+    format = 'zip' if sortie.lower().endswith('.zip') else 'pdf'
+    with assembler_lot_factures(chemins, format) as fichier, open(sortie, 'wb') as destination:
+        shutil.copyfileobj(fichier, destination)
+    print(f"{len(chemins)} facture(s) écrite(s) dans {sortie} en {time.perf_counter() - debut:.2f}s.")
 
 # Routes pour l'historique
+HISTORIQUE_PAR_PAGE = 50
+HISTORIQUE_PAR_PAGE_MAX = 200
+
+def encoder_curseur(date, id):
+    return f"{date.isoformat()}_{id}"
+
+def decoder_curseur(curseur):
+    """Retourne (date, id) à partir d'un curseur 'date-iso_id', ou None s'il est invalide."""
+    try:
+        date, id = curseur.rsplit('_', 1)
+        return datetime.fromisoformat(date), int(id)
+    except (AttributeError, ValueError):
+        return None
+
+def lire_date(valeur, fin_de_journee=False):
+    try:
+        date = datetime.strptime(valeur, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+    return date + timedelta(days=1) if fin_de_journee else date
+
+def page_suivante(query, colonne_date, colonne_id, curseur, par_page):
+    """Pagination par curseur (keyset) sur (date, id) décroissants.
+
+    Le coût ne dépend que de la taille de la page : la requête reprend
+    directement après le dernier élément affiché grâce à l'index (date, id).
+    Retourne (éléments, curseur suivant ou None).
+    """
+    position = decoder_curseur(curseur) if curseur else None
+    if position:
+        query = query.filter(tuple_(colonne_date, colonne_id) < position)
+    elements = query.order_by(colonne_date.desc(), colonne_id.desc()).limit(par_page + 1).all()
+    suivant = None
+    if len(elements) > par_page:
+        elements = elements[:par_page]
+        dernier = elements[-1]
+        suivant = encoder_curseur(getattr(dernier, colonne_date.key), dernier.id)
+    return elements, suivant
+
 @app.route('/historique')
 def historique():
-    historique_stock = Historique.query.order_by(Historique.date_operation.desc()).all()
-    ventes = Vente.query.order_by(Vente.date_vente.desc()).all()
-    return render_template('historique.html', historique_stock=historique_stock, ventes=ventes)
+    par_page = min(max(request.args.get('par_page', HISTORIQUE_PAR_PAGE, type=int) or HISTORIQUE_PAR_PAGE, 1), HISTORIQUE_PAR_PAGE_MAX)
+    du = lire_date(request.args.get('du'))
+    au = lire_date(request.args.get('au'), fin_de_journee=True)
+    ecran_id = request.args.get('ecran_id', type=int)
+    client_id = request.args.get('client_id', type=int)
+    type_operation = request.args.get('type_operation') or None
+
+    # Filtres conservés dans les liens de pagination
+    filtres = {
+        cle: request.args.get(cle)
+        for cle in ('du', 'au', 'ecran_id', 'client_id', 'type_operation', 'par_page')
+        if request.args.get(cle)
+    }
+
+    ventes_query = Vente.query.options(
+        joinedload(Vente.client),
+        joinedload(Vente.ecran).joinedload(Ecran.marque)
+    )
+    if du:
+        ventes_query = ventes_query.filter(Vente.date_vente >= du)
+    if au:
+        ventes_query = ventes_query.filter(Vente.date_vente < au)
+    if ecran_id:
+        ventes_query = ventes_query.filter(Vente.ecran_id == ecran_id)
+    if client_id:
+        ventes_query = ventes_query.filter(Vente.client_id == client_id)
+
+    stock_query = Historique.query.options(joinedload(Historique.ecran).joinedload(Ecran.marque))
+    if du:
+        stock_query = stock_query.filter(Historique.date_operation >= du)
+    if au:
+        stock_query = stock_query.filter(Historique.date_operation < au)
+    if ecran_id:
+        stock_query = stock_query.filter(Historique.ecran_id == ecran_id)
+    if type_operation:
+        stock_query = stock_query.filter(Historique.type_operation == type_operation)
+
+    apres_vente = request.args.get('apres_vente')
+    apres_stock = request.args.get('apres_stock')
+    ventes, suivant_vente = page_suivante(ventes_query, Vente.date_vente, Vente.id, apres_vente, par_page)
+    historique_stock, suivant_stock = page_suivante(stock_query, Historique.date_operation, Historique.id, apres_stock, par_page)
 
-# Routes pour les statistiques
-@app.route('/statistiques')
-def statistiques():
-    # Calculer les statistiques de base
-    total_ecrans = Ecran.query.count()
-    total_ventes = Vente.query.count()
-    total_clients = Client.query.count()
+    return render_template(
+        'historique.html',
+        historique_stock=historique_stock,
+        ventes=ventes,
+        filtres=filtres,
+        onglet=request.args.get('onglet', 'ventes'),
+        apres_vente=apres_vente,
+        apres_stock=apres_stock,
+        suivant_vente=suivant_vente,
+        suivant_stock=suivant_stock
+    )
 
-    # Calculer le chiffre d'affaires
-    chiffre_affaires = 0
-    for vente in Vente.query.all():
-        chiffre_affaires += vente.quantite * vente.prix_unitaire
+# Instantanés de stock et inventaire à une date
+# Le stock à une date part de l'instantané précédent et ajoute les mouvements
+# d'historique suivants : seule la tranche d'id entre deux instantanés est lue,
+# quel que soit l'âge de la date. instantane-stock est à planifier (cron
+# quotidien, de préférence hors des heures de vente : sous PostgreSQL, un
+# mouvement validé pendant l'instantané avec un id inférieur lui échapperait,
+# ce que reconcilier-stock signale alors comme un écart).
+def mouvement_signe():
+    return case((Historique.type_operation == 'ajout', Historique.quantite), else_=-Historique.quantite)
+
+def variations_stock(*conditions):
+    """Somme signée des mouvements par écran : sous-requête (ecran_id, variation)."""
+    return db.select(Historique.ecran_id, func.sum(mouvement_signe()).label('variation')) \
+        .where(*conditions).group_by(Historique.ecran_id).subquery()
+
+def instantane_voisin(instant=None, avant=True):
+    """(date_instantane, historique_id) du dernier instantané à `instant` ou avant
+    (tous confondus si instant est None), ou du premier après ; None s'il n'y en a pas."""
+    requete = db.select(StockInstantane.date_instantane, StockInstantane.historique_id)
+    if avant:
+        if instant is not None:
+            requete = requete.where(StockInstantane.date_instantane <= instant)
+        requete = requete.order_by(StockInstantane.date_instantane.desc())
+    else:
+        requete = requete.where(StockInstantane.date_instantane > instant) \
+            .order_by(StockInstantane.date_instantane)
+    return db.session.execute(requete.limit(1)).first()
+
+def stock_a(instant=None):
+    """Stock par écran d'après le registre : à `instant` (mouvements antérieurs
+    seulement) ou, si instant est None, avec tous les mouvements enregistrés.
+
+    Avant le premier instantané, on repart de celui-ci (ou du stock actuel s'il
+    n'y en a aucun) en retirant les mouvements postérieurs à `instant`.
+    Retourne (sous-requête ecran_id, marque_id, quantite, prix_achat ;
+    instantané de départ ou None).
+    """
+    precedent = instantane_voisin(instant)
+    suivant = instantane_voisin(instant, avant=False) if instant is not None else None
+    if precedent or instant is None:
+        # Vers l'avant ; sans aucun instantané, le registre est rejoué depuis zéro
+        depart, sens = precedent, 1
+        conditions = [Historique.id > precedent.historique_id] if precedent else []
+        if instant is not None:
+            conditions.append(Historique.date_operation < instant)
+    else:
+        depart, sens = suivant, -1
+        conditions = [Historique.date_operation >= instant]
+    if suivant:
+        conditions.append(Historique.id <= suivant.historique_id)
+    variation = variations_stock(*conditions)
+
+    if depart:
+        fige = db.select(StockInstantane.ecran_id, StockInstantane.quantite, StockInstantane.prix_achat) \
+            .where(StockInstantane.date_instantane == depart.date_instantane).subquery()
+        # Écran créé après l'instantané : 0 au départ
+        quantite = func.coalesce(fige.c.quantite, 0)
+        prix_achat = func.coalesce(fige.c.prix_achat, Ecran.prix_achat)
+    else:
+        quantite = Ecran.quantite if sens < 0 else 0
+        prix_achat = Ecran.prix_achat
+    requete = db.select(
+        Ecran.id.label('ecran_id'),
+        Ecran.marque_id,
+        (quantite + sens * func.coalesce(variation.c.variation, 0)).label('quantite'),
+        prix_achat.label('prix_achat')
+    ).select_from(Ecran).outerjoin(variation, variation.c.ecran_id == Ecran.id)
+    if depart:
+        requete = requete.outerjoin(fige, fige.c.ecran_id == Ecran.id)
+    return requete.subquery(), depart
+
+def creer_instantane_stock(maintenant=None):
+    """Fige Ecran.quantite et le prix d'achat de tous les écrans, avec le dernier
+    id d'historique, en un seul INSERT ... SELECT. Retourne le nombre d'écrans."""
+    maintenant = maintenant or datetime.utcnow()
+    dernier_mouvement = db.select(func.coalesce(func.max(Historique.id), 0)).scalar_subquery()
+    resultat = db.session.execute(insert(StockInstantane).from_select(
+        ['date_instantane', 'historique_id', 'ecran_id', 'quantite', 'prix_achat'],
+        db.select(bindparam('date_instantane', maintenant, type_=db.DateTime), dernier_mouvement,
+                  Ecran.id, Ecran.quantite, Ecran.prix_achat)
+    ))
+    db.session.commit()
+    return resultat.rowcount
+
+def ecarts_stock():
+    """Écrans dont Ecran.quantite diffère du stock reconstitué par le registre
+    (dernier instantané + mouvements suivants) : [(id, barcode, nom, quantite, registre)]."""
+    registre, _ = stock_a()
+    return db.session.execute(
+        db.select(Ecran.id, Ecran.barcode, Ecran.nom, Ecran.quantite, registre.c.quantite)
+        .join(registre, registre.c.ecran_id == Ecran.id)
+        .where(Ecran.quantite != registre.c.quantite)
+        .order_by(Ecran.id)
+    ).all()
+
+def lire_instant(arguments):
+    """?instant=ISO 8601, ou ?au=AAAA-MM-JJ (fin de journée) ; maintenant par défaut."""
+    if arguments.get('instant'):
+        try:
+            return datetime.fromisoformat(arguments['instant'])
+        except ValueError:
+            return None
+    if arguments.get('au'):
+        return lire_date(arguments['au'], fin_de_journee=True)
+    return datetime.utcnow()
+
+@app.route('/inventaire')
+def inventaire():
+    """Quantité et valeur (prix d'achat) du stock à une date, par marque."""
+    instant = lire_instant(request.args)
+    if instant is None:
+        abort(400)
+    stock, depart = stock_a(instant)
+    requete = db.select(
+        Marque.nom, func.sum(stock.c.quantite), func.sum(stock.c.quantite * stock.c.prix_achat)
+    ).join(Marque, stock.c.marque_id == Marque.id)
+    if request.args.get('marque_id', type=int):
+        requete = requete.where(stock.c.marque_id == request.args.get('marque_id', type=int))
+    par_marque = [
+        {'marque': nom, 'quantite': int(quantite or 0), 'valeur': round(valeur or 0, 2)}
+        for nom, quantite, valeur in db.session.execute(requete.group_by(Marque.nom).order_by(Marque.nom))
+    ]
+    return jsonify({
+        'instant': instant.isoformat(),
+        'instantane': depart.date_instantane.isoformat() if depart else None,
+        'quantite': sum(m['quantite'] for m in par_marque),
+        'valeur': round(sum(m['valeur'] for m in par_marque), 2),
+        'marques': par_marque
+    })
+
+@app.cli.command('instantane-stock')
+def instantane_stock_command():
+    """Enregistre un instantané du stock de tous les écrans (à planifier)."""
+    ecarts = len(ecarts_stock())
+    nombre = creer_instantane_stock()
+    print(f"Instantané de {nombre} écrans enregistré.")
+    if ecarts:
+        print(f"Attention: {ecarts} écran(s) en écart avec l'historique (voir reconcilier-stock).")
+
+@app.cli.command('reconcilier-stock')
+@click.option('--corriger', is_flag=True, help="ajoute à l'historique les mouvements qui manquent")
+def reconcilier_stock_command(corriger):
+    """Compare Ecran.quantite au stock reconstitué par l'historique."""
+    ecarts = ecarts_stock()
+    for id, barcode, nom, quantite, registre in ecarts:
+        print(f"  {barcode} {nom}: stock {quantite}, historique {registre} ({quantite - registre:+d})")
+    if not ecarts:
+        print("Aucun écart entre le stock et l'historique.")
+        return
+    if not corriger:
+        print(f"{len(ecarts)} écart(s) ; relancer avec --corriger pour les enregistrer dans l'historique.")
+        raise SystemExit(1)
+    maintenant = datetime.utcnow()
+    db.session.execute(insert(Historique), [{
+        'date_operation': maintenant,
+        'type_operation': 'ajout' if quantite > registre else 'retrait',
+        'quantite': abs(quantite - registre),
+        'ecran_id': id
+    } for id, _, _, quantite, registre in ecarts])
+    db.session.commit()
+    print(f"{len(ecarts)} mouvement(s) de régularisation ajoutés à l'historique.")
+
+# Exports comptables en flux (CSV / XLSX)
+app.config.setdefault('EXPORT_LOT', 1000)
+
+def export_ventes(du, au):
+    requete = db.select(
+        Vente.id, Vente.facture_id, Vente.date_vente, Client.nom, Client.prenom,
+        Marque.nom, Ecran.nom, Ecran.barcode, Vente.quantite, Vente.prix_unitaire,
+        Vente.quantite * Vente.prix_unitaire
+    ).join(Client, Vente.client_id == Client.id) \
+     .join(Ecran, Vente.ecran_id == Ecran.id) \
+     .join(Marque, Ecran.marque_id == Marque.id)
+    if du:
+        requete = requete.where(Vente.date_vente >= du)
+    if au:
+        requete = requete.where(Vente.date_vente < au)
+    if request.args.get('client_id', type=int):
+        requete = requete.where(Vente.client_id == request.args.get('client_id', type=int))
+    if request.args.get('ecran_id', type=int):
+        requete = requete.where(Vente.ecran_id == request.args.get('ecran_id', type=int))
+    entetes = ['id', 'facture', 'date', 'client_nom', 'client_prenom', 'marque', 'ecran',
+               'barcode', 'quantite', 'prix_unitaire', 'total']
+    return entetes, requete.order_by(Vente.date_vente, Vente.id)
+
+def export_mouvements(du, au):
+    requete = db.select(
+        Historique.id, Historique.date_operation, Historique.type_operation,
+        Marque.nom, Ecran.nom, Ecran.barcode, Historique.quantite
+    ).join(Ecran, Historique.ecran_id == Ecran.id) \
+     .join(Marque, Ecran.marque_id == Marque.id)
+    if du:
+        requete = requete.where(Historique.date_operation >= du)
+    if au:
+        requete = requete.where(Historique.date_operation < au)
+    if request.args.get('ecran_id', type=int):
+        requete = requete.where(Historique.ecran_id == request.args.get('ecran_id', type=int))
+    if request.args.get('type_operation'):
+        requete = requete.where(Historique.type_operation == request.args.get('type_operation'))
+    entetes = ['id', 'date', 'type_operation', 'marque', 'ecran', 'barcode', 'quantite']
+    return entetes, requete.order_by(Historique.date_operation, Historique.id)
+
+def export_inventaire(du, au):
+    """Stock à la fin du jour `au` (instantanés + historique), sinon stock actuel ; `du` ne s'applique pas."""
+    if au:
+        stock, _ = stock_a(au)
+        quantite, prix_achat = stock.c.quantite, stock.c.prix_achat
+    else:
+        quantite, prix_achat = Ecran.quantite, Ecran.prix_achat
+    requete = db.select(
+        Ecran.id, Ecran.barcode, Marque.nom, Ecran.nom, prix_achat, Ecran.prix_vente,
+        quantite, Ecran.seuil_alerte, quantite * prix_achat
+    ).join(Marque, Ecran.marque_id == Marque.id)
+    if au:
+        requete = requete.join(stock, stock.c.ecran_id == Ecran.id)
+    if request.args.get('marque_id', type=int):
+        requete = requete.where(Ecran.marque_id == request.args.get('marque_id', type=int))
+    entetes = ['id', 'barcode', 'marque', 'nom', 'prix_achat', 'prix_vente', 'quantite',
+               'seuil_alerte', 'valeur_stock']
+    return entetes, requete.order_by(Ecran.id)
+
+EXPORTS = {
+    'ventes': export_ventes,
+    'mouvements': export_mouvements,
+    'inventaire': export_inventaire
+}
+
+def lignes_export(requete):
+    """Itère sur les résultats par paquets de EXPORT_LOT lignes.
+
+    yield_per active un curseur côté serveur sous PostgreSQL : la mémoire
+    utilisée ne dépend pas du nombre de lignes exportées.
+    """
+    resultat = db.session.execute(requete.execution_options(yield_per=app.config['EXPORT_LOT']))
+    for ligne in resultat:
+        yield [valeur.strftime('%Y-%m-%d %H:%M:%S') if isinstance(valeur, datetime) else valeur
+               for valeur in ligne]
+
+def flux_csv(entetes, lignes):
+    """Génère le CSV par morceaux (séparateur ; et BOM pour Excel)."""
+    tampon = io.StringIO()
+    ecrivain = csv.writer(tampon, delimiter=';')
+    ecrivain.writerow(entetes)
+    yield '\ufeff' + tampon.getvalue()
+    tampon.seek(0)
+    tampon.truncate()
+    for numero, ligne in enumerate(lignes, start=1):
+        ecrivain.writerow(ligne)
+        if numero % 500 == 0:
+            yield tampon.getvalue()
+            tampon.seek(0)
+            tampon.truncate()
+    yield tampon.getvalue()
+
+def fichier_xlsx(entetes, lignes, titre):
+    """Classeur en mode write_only : les lignes sont écrites au fil de l'eau
+    dans un fichier temporaire, sans garder la feuille en mémoire."""
+    import openpyxl
+
+    classeur = openpyxl.Workbook(write_only=True)
+    feuille = classeur.create_sheet(titre)
+    feuille.append(entetes)
+    for ligne in lignes:
+        feuille.append(ligne)
+    fichier = tempfile.TemporaryFile()
+    classeur.save(fichier)
+    fichier.seek(0)
+    return fichier
+
+@app.route('/export/<nom>.<any(csv, xlsx):format>')
+def exporter(nom, format):
+    """Exports ventes, mouvements et inventaire, filtrés par ?du=&au= (AAAA-MM-JJ)."""
+    if nom not in EXPORTS:
+        abort(404)
+    du = lire_date(request.args.get('du'))
+    au = lire_date(request.args.get('au'), fin_de_journee=True)
+    entetes, requete = EXPORTS[nom](du, au)
+
+    periode = '_'.join(request.args.get(cle) for cle in ('du', 'au') if lire_date(request.args.get(cle)))
+    nom_fichier = f"{nom}_{periode or datetime.now().strftime('%Y-%m-%d')}.{format}"
+
+    if format == 'xlsx':
+        fichier = fichier_xlsx(entetes, lignes_export(requete), nom)
+        return send_file(fichier, as_attachment=True, download_name=nom_fichier,
+                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+    # Le téléchargement commence dès les premières lignes
+    return app.response_class(
+        stream_with_context(flux_csv(entetes, lignes_export(requete))),
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': f'attachment; filename={nom_fichier}',
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
-    # Calculer le coût d'achat total
+# Agrégations SQL pour les statistiques
+def agreger_ventes():
+    """Calcule les agrégats de ventes (CA, coût, quantités) par mois et par marque.
+
+    Lit la table des cumuls journaliers (quelques centaines de lignes) plutôt
+    que les ventes brutes, avec un seul GROUP BY par mois et par marque.
+    EXTRACT est traduit par SQLAlchemy pour SQLite (strftime) comme pour
+    PostgreSQL.
+    """
+    annee = extract('year', VenteJournaliere.jour)
+    mois = extract('month', VenteJournaliere.jour)
+    lignes = db.session.query(
+        annee.label('annee'),
+        mois.label('mois'),
+        Marque.nom.label('marque'),
+        func.sum(VenteJournaliere.nombre_ventes).label('nombre'),
+        func.sum(VenteJournaliere.quantite).label('quantite'),
+        func.sum(VenteJournaliere.chiffre_affaires).label('chiffre_affaires'),
+        func.sum(VenteJournaliere.cout_achat).label('cout_achat')
+    ).join(Marque, VenteJournaliere.marque_id == Marque.id) \
+     .group_by(annee, mois, Marque.nom) \
+     .all()
+
+    total_ventes = 0
+    chiffre_affaires = 0
     cout_achat_total = 0
-    for vente in Vente.query.all():
-        cout_achat_total += vente.quantite * vente.ecran.prix_achat
+    ventes_par_mois = {}
+    ventes_par_marque = {}
+    for ligne in lignes:
+        cle_mois = f"{int(ligne.annee):04d}-{int(ligne.mois):02d}"
+        ca = float(ligne.chiffre_affaires or 0)
+        total_ventes += int(ligne.nombre or 0)
+        chiffre_affaires += ca
+        cout_achat_total += float(ligne.cout_achat or 0)
+        ventes_par_mois[cle_mois] = ventes_par_mois.get(cle_mois, 0) + ca
+        ventes_par_marque[ligne.marque] = ventes_par_marque.get(ligne.marque, 0) + int(ligne.quantite or 0)
+
+    return {
+        'total_ventes': total_ventes,
+        'chiffre_affaires': chiffre_affaires,
+        'cout_achat_total': cout_achat_total,
+        'benefice': chiffre_affaires - cout_achat_total,
+        'ventes_par_mois': dict(sorted(ventes_par_mois.items())),
+        'ventes_par_marque': ventes_par_marque
+    }
+
+def compter_catalogue():
+    """Retourne (total_ecrans, total_clients) en un seul aller-retour."""
+    return db.session.query(
+        db.session.query(func.count(Ecran.id)).scalar_subquery(),
+        db.session.query(func.count(Client.id)).scalar_subquery()
+    ).one()
+
+# Modèle de prédiction des ventes (entraîné hors du chemin des requêtes)
+app.config.setdefault('MODELE_VENTES_PATH', os.path.join(app.root_path, 'ventes_model.pkl'))
+_modele_ventes = {'mtime': None, 'contenu': None}
+_entrainement_lock = threading.Lock()
+
+def mois_complets(ventes_par_mois):
+    """Ne garde que les mois terminés : le mois en cours est encore partiel."""
+    mois_courant = datetime.utcnow().strftime('%Y-%m')
+    return {mois: total for mois, total in ventes_par_mois.items() if mois < mois_courant}
+
+def charger_modele_ventes():
+    """Retourne {'modele', 'metadonnees'} depuis le disque, gardé en mémoire.
+
+    Le fichier n'est relu que lorsque sa date de modification change, c'est-à-dire
+    après un nouvel entraînement. Un ancien fichier sans métadonnées est ignoré.
+    """
+    chemin = app.config['MODELE_VENTES_PATH']
+    try:
+        mtime = os.stat(chemin).st_mtime_ns
+    except OSError:
+        return None
 
-    # Calculer le bénéfice
-    benefice = chiffre_affaires - cout_achat_total
+    if _modele_ventes['mtime'] != mtime:
+        import joblib
 
-    # Préparation des données pour les graphiques
-    ventes_par_mois = {}
-    for vente in Vente.query.all():
-        mois = vente.date_vente.strftime('%Y-%m')
-        if mois not in ventes_par_mois:
-            ventes_par_mois[mois] = 0
-        ventes_par_mois[mois] += vente.quantite * vente.prix_unitaire
+        try:
+            contenu = joblib.load(chemin)
+        except Exception as e:
+            metriques.incrementer('erreurs_prevision_total', libelles(etape='chargement'))
+            app.logger.warning(f"Erreur lors du chargement du modèle: {e}")
+            contenu = None
+        if not isinstance(contenu, dict) or 'metadonnees' not in contenu:
+            contenu = None
+        _modele_ventes['mtime'] = mtime
+        _modele_ventes['contenu'] = contenu
+    return _modele_ventes['contenu']
+
+def entrainer_modele_ventes(force=False):
+    """Entraîne la régression sur les mois complets et l'enregistre atomiquement.
+
+    Ne fait rien si le modèle enregistré couvre déjà le dernier mois complet,
+    sauf si force=True. Retourne True si un nouveau modèle a été enregistré.
+    """
+    import joblib
+    import numpy as np
+    import pandas as pd
+    from sklearn.linear_model import LinearRegression
+
+    serie = mois_complets(agreger_ventes()['ventes_par_mois'])
+    if not serie:
+        return False
+
+    dernier_mois = max(serie)
+    actuel = charger_modele_ventes()
+    if not force and actuel and actuel['metadonnees']['dernier_mois'] == dernier_mois:
+        return False
+
+    mois_num = pd.PeriodIndex(list(serie.keys()), freq='M').astype(int)
+    X = np.array(mois_num).reshape(-1, 1)
+    y = np.array(list(serie.values()))
+
+    model = LinearRegression()
+    model.fit(X, y)
+
+    contenu = {
+        'modele': model,
+        'metadonnees': {
+            'premier_mois': min(serie),
+            'dernier_mois': dernier_mois,
+            'dernier_mois_num': int(mois_num.max()),
+            'nombre_mois': len(serie),
+            'version_ventes': version_donnees_ventes(),
+            'entraine_le': datetime.utcnow().isoformat()
+        }
+    }
+
+    # Écriture dans un fichier temporaire puis renommage atomique
+    chemin = app.config['MODELE_VENTES_PATH']
+    temporaire = f'{chemin}.{os.getpid()}.tmp'
+    joblib.dump(contenu, temporaire)
+    os.replace(temporaire, chemin)
+    return True
+
+def lancer_entrainement_en_arriere_plan():
+    """Lance entrainer_modele_ventes dans un thread, un seul à la fois par worker."""
+    if not _entrainement_lock.acquire(blocking=False):
+        return
+
+    def tache():
+        try:
+            with app.app_context():
+                entrainer_modele_ventes()
+        except Exception:
+            metriques.incrementer('erreurs_prevision_total', libelles(etape='entrainement'))
+            app.logger.exception("Erreur lors de l'entraînement du modèle")
+        finally:
+            _entrainement_lock.release()
+
+    threading.Thread(target=tache, daemon=True).start()
+
+@app.cli.command('entrainer-modele')
+@click.option('--force', is_flag=True, help="Réentraîner même sans nouveau mois complet.")
+def entrainer_modele_command(force):
+    """Entraîne le modèle de prédiction des ventes (ventes_model.pkl)."""
+    if entrainer_modele_ventes(force=force):
+        print(f"Modèle enregistré dans {app.config['MODELE_VENTES_PATH']}.")
+    else:
+        print("Modèle déjà à jour, aucun entraînement nécessaire.")
 
-    ventes_par_marque = {}
-    for vente in Vente.query.all():
-        marque = vente.ecran.marque.nom
-        if marque not in ventes_par_marque:
-            ventes_par_marque[marque] = 0
-        ventes_par_marque[marque] += vente.quantite
-
-    # Création des graphiques
-    # Graphique des ventes par mois
-    plt.figure(figsize=(10, 5))
-    mois = list(ventes_par_mois.keys())
-    ventes = list(ventes_par_mois.values())
-    plt.bar(mois, ventes, color='skyblue')
-    plt.xlabel('Mois')
-    plt.ylabel("Chiffre d'affaires (TND)")
-    plt.title("Chiffre d'affaires par mois")
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    img = io.BytesIO()
-    plt.savefig(img, format='png')
-    img.seek(0)
-    graphique_ventes_mois = base64.b64encode(img.getvalue()).decode('utf-8')
-    plt.close()
-
-    # Graphique des ventes par marque
-    plt.figure(figsize=(10, 5))
-    marques = list(ventes_par_marque.keys())
-    quantites = list(ventes_par_marque.values())
-    plt.pie(quantites, labels=marques, autopct='%1.1f%%')
-    plt.title('Répartition des ventes par marque')
-    plt.tight_layout()
-
-    img = io.BytesIO()
-    plt.savefig(img, format='png')
-    img.seek(0)
-    graphique_ventes_marque = base64.b64encode(img.getvalue()).decode('utf-8')
-    plt.close()
+def calculer_predictions(ventes_par_mois):
+    """Prédit le chiffre d'affaires des 3 prochains mois avec le modèle enregistré.
+
+    Aucun entraînement ni écriture disque ici : si le modèle manque ou ne
+    couvre pas le dernier mois complet, il est réentraîné en arrière-plan.
+    Retourne None s'il n'y a pas de ventes ou pas encore de modèle.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if not ventes_par_mois:
+        return None
+
+    serie = mois_complets(ventes_par_mois)
+    contenu = charger_modele_ventes()
+    if serie and (contenu is None or contenu['metadonnees']['dernier_mois'] != max(serie)):
+        lancer_entrainement_en_arriere_plan()
+    if contenu is None:
+        return None
 
-    # Prédiction des ventes avec l'IA
     try:
-        # Préparation des données pour la prédiction
-        ventes_data = []
-        for vente in Vente.query.all():
-            ventes_data.append({
-                'date': vente.date_vente,
-                'quantite': vente.quantite,
-                'prix': vente.prix_unitaire,
-                'total': vente.quantite * vente.prix_unitaire
-            })
+        metadonnees = contenu['metadonnees']
+        dernier_mois = metadonnees['dernier_mois_num']
+        mois_futurs = np.array([dernier_mois + 1, dernier_mois + 2, dernier_mois + 3]).reshape(-1, 1)
+        predictions = contenu['modele'].predict(mois_futurs)
+        mois_num = pd.PeriodIndex(list(ventes_par_mois.keys()), freq='M').astype(int)
+    except Exception:
+        metriques.incrementer('erreurs_prevision_total', libelles(etape='prediction'))
+        app.logger.exception("Erreur lors de la prédiction")
+        return None
+
+    return {
+        'mois_num': [int(m) for m in mois_num],
+        'totaux': list(ventes_par_mois.values()),
+        'mois_futurs': mois_futurs.ravel().tolist(),
+        'predictions': predictions.tolist(),
+        'dernier_mois': metadonnees['dernier_mois']
+    }
+
+# Prévision de la demande par écran et points de commande
+app.config.setdefault('PREVISION_SEMAINES', 26)        # historique utilisé (semaines)
+app.config.setdefault('DELAI_REAPPRO_JOURS', 7)        # délai de livraison fournisseur
+app.config.setdefault('PERIODE_REVISION_JOURS', 14)    # stock à couvrir entre deux commandes
+app.config.setdefault('NIVEAU_SERVICE_Z', 1.65)        # ~95% de taux de service
+app.config.setdefault('PREVISIONS_TTL', 600)           # secondes de validité en mémoire
+# Seuils et stocks cibles du dernier calcul, relus par les alertes sans pandas
+app.config.setdefault('SUGGESTIONS_REAPPRO_PATH', os.path.join(app.instance_path, 'suggestions_reappro.json'))
+_previsions_reappro = {'calcule_le': None, 'resultat': None}
+_suggestions_reappro = {'mtime': None, 'contenu': {}}
+
+def calculer_previsions_reappro():
+    """Prévoit la demande de chaque écran et propose seuils et quantités à commander.
+
+    Les cumuls journaliers des dernières semaines sont mis sous forme d'une
+    matrice écrans x semaines ; tendance linéaire, écart-type résiduel, point de
+    commande et quantité à commander sont calculés pour tous les écrans à la fois
+    avec NumPy, sans boucle Python par produit.
+    """
+    import numpy as np
+    import pandas as pd
+
+    semaines = app.config['PREVISION_SEMAINES']
+    delai = app.config['DELAI_REAPPRO_JOURS']
+    revision = app.config['PERIODE_REVISION_JOURS']
+    z = app.config['NIVEAU_SERVICE_Z']
+
+    aujourd_hui = datetime.utcnow().date()
+    debut = aujourd_hui - timedelta(days=7 * semaines - 1)
+
+    ecrans = pd.DataFrame(
+        db.session.query(Ecran.id, Ecran.nom, Marque.nom, Ecran.quantite, Ecran.seuil_alerte)
+        .join(Marque, Ecran.marque_id == Marque.id)
+        .order_by(Ecran.id)
+        .all(),
+        columns=['id', 'nom', 'marque', 'quantite', 'seuil_alerte']
+    )
+    if ecrans.empty:
+        return []
+
+    ventes = pd.DataFrame(
+        db.session.query(VenteJournaliere.ecran_id, VenteJournaliere.jour, VenteJournaliere.quantite)
+        .filter(VenteJournaliere.jour >= debut)
+        .all(),
+        columns=['ecran_id', 'jour', 'quantite']
+    )
 
-        if ventes_data:
-            df = pd.DataFrame(ventes_data)
-            df['date'] = pd.to_datetime(df['date'])
-            df = df.sort_values('date')
-            df['mois'] = df['date'].dt.to_period('M')
-
-            # Agréger les ventes par mois
-            ventes_mensuelles = df.groupby('mois')['total'].sum().reset_index()
-            ventes_mensuelles['mois_num'] = ventes_mensuelles['mois'].astype(int)
-
-            # Entraîner le modèle de régression linéaire
-            X = np.array(ventes_mensuelles['mois_num']).reshape(-1, 1)
-            y = np.array(ventes_mensuelles['total'])
-
-            model = LinearRegression()
-            model.fit(X, y)
-
-            # Sauvegarder le modèle
-            joblib.dump(model, 'ventes_model.pkl')
-
-            # Prédire les ventes pour les 3 prochains mois
-            dernier_mois = ventes_mensuelles['mois_num'].max()
-            mois_futurs = np.array([dernier_mois + 1, dernier_mois + 2, dernier_mois + 3]).reshape(-1, 1)
-            predictions = model.predict(mois_futurs)
-
-            # Créer un graphique avec les prédictions
-            plt.figure(figsize=(10, 5))
-            plt.plot(ventes_mensuelles['mois_num'], ventes_mensuelles['total'], 'o-', label='Ventes réelles')
-            plt.plot(mois_futurs, predictions, 'o--', label='Prédictions')
-            plt.xlabel('Mois')
-            plt.ylabel("Chiffre d'affaires (TND)")
-            plt.title("Prédiction des ventes pour les 3 prochains mois")
-            plt.legend()
-            plt.grid(True)
-            plt.tight_layout()
-
-            img = io.BytesIO()
-            plt.savefig(img, format='png')
-            img.seek(0)
-            graphique_predictions = base64.b64encode(img.getvalue()).decode('utf-8')
-            plt.close()
-
-            # Formater les prédictions pour l'affichage
-            predictions_formatees = [f"{pred:.2f} TND" for pred in predictions]
-        else:
-            graphique_predictions = None
-            predictions_formatees = []
-    except Exception as e:
-        print(f"Erreur lors de la prédiction: {e}")
+    # Matrice des quantités vendues : une ligne par écran, une colonne par semaine
+    demande = np.zeros((len(ecrans), semaines))
+    if not ventes.empty:
+        jours = (pd.to_datetime(ventes['jour']) - pd.Timestamp(debut)).dt.days.to_numpy()
+        lignes = pd.Index(ecrans['id']).get_indexer(ventes['ecran_id'])
+        valides = lignes >= 0
+        np.add.at(demande, (lignes[valides], jours[valides] // 7), ventes['quantite'].to_numpy()[valides])
+
+    # Régression linéaire vectorisée (moindres carrés sur x centré)
+    x = np.arange(semaines) - (semaines - 1) / 2
+    moyenne = demande.mean(axis=1)
+    pente = demande @ x / (x @ x)
+    residus = demande - moyenne[:, None] - pente[:, None] * x[None, :]
+    ecart_type = residus.std(axis=1, ddof=2 if semaines > 2 else 0)
+
+    # Demande hebdomadaire attendue sur l'horizon délai + révision
+    horizon = (delai + revision) / 7
+    x_futur = (semaines - 1) / 2 + (1 + horizon) / 2
+    hebdo = np.clip(moyenne + pente * x_futur, 0, None)
+    journaliere = hebdo / 7
+    ecart_journalier = ecart_type / np.sqrt(7)
+
+    stock_securite = z * ecart_journalier * np.sqrt(delai)
+    point_commande = journaliere * delai + stock_securite
+    stock_cible = np.round(journaliere * (delai + revision) + stock_securite, 2)
+    a_commander = np.clip(np.ceil(stock_cible - ecrans['quantite'].to_numpy()), 0, None)
+
+    resultat = ecrans.assign(
+        demande_hebdo=np.round(hebdo, 2),
+        stock_securite=np.round(stock_securite, 2),
+        seuil_suggere=np.ceil(point_commande).astype(int),
+        stock_cible=stock_cible,
+        a_commander=a_commander.astype(int)
+    )
+    return resultat.sort_values(['a_commander', 'id'], ascending=[False, True]).to_dict('records')
+
+def previsions_reappro(forcer=False):
+    """Résultat de calculer_previsions_reappro, gardé en mémoire PREVISIONS_TTL secondes."""
+    calcule_le = _previsions_reappro['calcule_le']
+    if forcer or calcule_le is None or time.monotonic() - calcule_le > app.config['PREVISIONS_TTL']:
+        _previsions_reappro['resultat'] = calculer_previsions_reappro()
+        _previsions_reappro['calcule_le'] = time.monotonic()
+        enregistrer_suggestions_reappro(_previsions_reappro['resultat'])
+    return _previsions_reappro['resultat']
+
+def enregistrer_suggestions_reappro(previsions):
+    contenu = {int(p['id']): {'seuil_suggere': int(p['seuil_suggere']), 'stock_cible': float(p['stock_cible'])}
+               for p in previsions}
+    ecrire_atomiquement(app.config['SUGGESTIONS_REAPPRO_PATH'], json.dumps(contenu))
+
+def suggestions_reappro():
+    """{id écran: {'seuil_suggere', 'stock_cible'}} du dernier calcul enregistré.
+
+    Lu par les alertes de stock : le fichier n'est relu que lorsque sa date de
+    modification change, et ni pandas ni NumPy ne sont chargés. Vide tant
+    qu'aucune prévision n'a été calculée (previsions-reappro).
+    """
+    chemin = app.config['SUGGESTIONS_REAPPRO_PATH']
+    try:
+        mtime = os.stat(chemin).st_mtime_ns
+    except OSError:
+        return {}
+    if _suggestions_reappro['mtime'] != mtime:
+        try:
+            with open(chemin) as f:
+                contenu = {int(id): valeurs for id, valeurs in json.load(f).items()}
+        except (OSError, ValueError):
+            contenu = {}
+        _suggestions_reappro['mtime'] = mtime
+        _suggestions_reappro['contenu'] = contenu
+    return _suggestions_reappro['contenu']
+
+@app.route('/previsions_reappro')
+def previsions_reappro_json():
+    previsions = previsions_reappro()
+    if request.args.get('a_commander'):
+        previsions = [p for p in previsions if p['a_commander'] > 0]
+    return jsonify({
+        'parametres': {
+            'semaines': app.config['PREVISION_SEMAINES'],
+            'delai_jours': app.config['DELAI_REAPPRO_JOURS'],
+            'revision_jours': app.config['PERIODE_REVISION_JOURS'],
+            'niveau_service_z': app.config['NIVEAU_SERVICE_Z']
+        },
+        'ecrans': [{k: (v.item() if hasattr(v, 'item') else v) for k, v in p.items()} for p in previsions]
+    })
+
+@app.cli.command('appliquer-seuils')
+def appliquer_seuils_command():
+    """Remplace seuil_alerte par le point de commande calculé (écrans vendus récemment)."""
+    modifications = [
+        {'id': int(p['id']), 'seuil_alerte': int(p['seuil_suggere'])}
+        for p in previsions_reappro(forcer=True)
+        if p['demande_hebdo'] > 0 and p['seuil_suggere'] != p['seuil_alerte']
+    ]
+    if modifications:
+        db.session.execute(update(Ecran), modifications)
+        db.session.commit()
+        signaler_changement_stock()
+    print(f"{len(modifications)} seuils d'alerte mis à jour.")
+
+@app.cli.command('previsions-reappro')
+def previsions_reappro_command():
+    """Recalcule les prévisions et enregistre les seuils suggérés affichés dans les alertes."""
+    previsions = previsions_reappro(forcer=True)
+    print(f"Prévisions de {len(previsions)} écrans enregistrées dans {app.config['SUGGESTIONS_REAPPRO_PATH']}.")
+
+# Graphiques des statistiques (rendus une fois par version des ventes)
+GRAPHIQUES = ('ventes_mois', 'ventes_marque', 'predictions')
+app.config.setdefault('GRAPHIQUES_CACHE_DIR', os.path.join(app.instance_path, 'graphiques'))
+
+def version_donnees_ventes():
+    """Version des données de ventes : dernier id de Vente et nombre de ventes."""
+    dernier_id, nombre = db.session.query(func.max(Vente.id), func.count(Vente.id)).one()
+    return f"{dernier_id or 0}-{nombre}"
+
+def figure_en_png(fig):
+    # Figure indépendante de pyplot : aucun état global partagé entre requêtes
+    img = BytesIO()
+    with chronometre_rendu('matplotlib'):
+        fig.tight_layout()
+        fig.savefig(img, format='png')
+    return img.getvalue()
+
+def tracer_ventes_mois(ventes_par_mois):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    ax.bar(list(ventes_par_mois.keys()), list(ventes_par_mois.values()), color='skyblue')
+    ax.set_xlabel('Mois')
+    ax.set_ylabel("Chiffre d'affaires (TND)")
+    ax.set_title("Chiffre d'affaires par mois")
+    ax.tick_params(axis='x', labelrotation=45)
+    return figure_en_png(fig)
+
+def tracer_ventes_marque(ventes_par_marque):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    ax.pie(list(ventes_par_marque.values()), labels=list(ventes_par_marque.keys()), autopct='%1.1f%%')
+    ax.set_title('Répartition des ventes par marque')
+    return figure_en_png(fig)
+
+def tracer_predictions(prevision):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    ax.plot(prevision['mois_num'], prevision['totaux'], 'o-', label='Ventes réelles')
+    ax.plot(prevision['mois_futurs'], prevision['predictions'], 'o--', label='Prédictions')
+    ax.set_xlabel('Mois')
+    ax.set_ylabel("Chiffre d'affaires (TND)")
+    ax.set_title("Prédiction des ventes pour les 3 prochains mois")
+    ax.legend()
+    ax.grid(True)
+    return figure_en_png(fig)
+
+def generer_graphique(nom):
+    """Rend le graphique demandé en PNG, ou None s'il n'y a pas de données."""
+    agregats = agreger_ventes()
+    if nom == 'ventes_mois':
+        donnees = agregats['ventes_par_mois']
+        return tracer_ventes_mois(donnees) if donnees else None
+    if nom == 'ventes_marque':
+        donnees = agregats['ventes_par_marque']
+        return tracer_ventes_marque(donnees) if donnees else None
+    prevision = calculer_predictions(agregats['ventes_par_mois'])
+    return tracer_predictions(prevision) if prevision else None
+
+def version_graphique(nom, version_ventes):
+    """Le graphique des prédictions dépend aussi du modèle entraîné."""
+    if nom == 'predictions':
+        contenu = charger_modele_ventes()
+        dernier_mois = contenu['metadonnees']['dernier_mois'] if contenu else 'aucun'
+        return f"{version_ventes}-{dernier_mois}"
+    return version_ventes
+
+def graphique_en_cache(nom, version):
+    """Chemin du PNG en cache pour cette version des ventes, généré si absent.
+
+    Les fichiers sont partagés entre les workers : l'écriture passe par un
+    fichier temporaire puis os.replace, et les anciennes versions sont purgées.
+    """
+    dossier = app.config['GRAPHIQUES_CACHE_DIR']
+    chemin = os.path.join(dossier, f'{nom}-{version}.png')
+    if os.path.exists(chemin):
+        return chemin
+
+    png = generer_graphique(nom)
+    if png is None:
+        return None
+
+    os.makedirs(dossier, exist_ok=True)
+    temporaire = f'{chemin}.{os.getpid()}.tmp'
+    with open(temporaire, 'wb') as f:
+        f.write(png)
+    os.replace(temporaire, chemin)
+
+    for fichier in os.listdir(dossier):
+        if fichier.startswith(f'{nom}-') and fichier.endswith('.png') and fichier != os.path.basename(chemin):
+            try:
+                os.remove(os.path.join(dossier, fichier))
+            except OSError:
+                pass
+    return chemin
+
+@app.route('/graphiques/<nom>.png')
+def graphique(nom):
+    if nom not in GRAPHIQUES:
+        abort(404)
+    version = version_graphique(nom, version_donnees_ventes())
+    chemin = graphique_en_cache(nom, version)
+    if chemin is None:
+        abort(404)
+    # L'URL versionnée (?v=...) ne change jamais de contenu : cache long.
+    # Sans version, le navigateur revalide avec ETag / Last-Modified (304).
+    max_age = 31536000 if request.args.get('v') == version else 0
+    return send_file(chemin, mimetype='image/png', etag=f'{nom}-{version}', conditional=True, max_age=max_age)
+
+# Routes pour les statistiques
+@app.route('/statistiques')
+def statistiques():
+    # Calculer les statistiques de base
+    total_ecrans, total_clients = compter_catalogue()
+    agregats = agreger_ventes()
+    total_ventes = agregats['total_ventes']
+    chiffre_affaires = agregats['chiffre_affaires']
+    cout_achat_total = agregats['cout_achat_total']
+    benefice = agregats['benefice']
+
+    # Les graphiques sont servis par /graphiques/<nom>.png (mis en cache)
+    version = version_donnees_ventes()
+    graphique_ventes_mois = None
+    graphique_ventes_marque = None
+    if agregats['ventes_par_mois']:
+        graphique_ventes_mois = url_for('graphique', nom='ventes_mois', v=version)
+        graphique_ventes_marque = url_for('graphique', nom='ventes_marque', v=version)
+
+    # Prédiction des ventes avec l'IA
+    prevision = calculer_predictions(agregats['ventes_par_mois'])
+    if prevision:
+        graphique_predictions = url_for('graphique', nom='predictions', v=f"{version}-{prevision['dernier_mois']}")
+        # Formater les prédictions pour l'affichage
+        predictions_formatees = [f"{pred:.2f} TND" for pred in prevision['predictions']]
+    else:
         graphique_predictions = None
         predictions_formatees = []
 
@@ -612,53 +2577,600 @@ def statistiques():
         predictions=predictions_formatees
     )
 
+# Indicateurs de la page d'accueil : une seule requête (sous-requêtes
+# scalaires), gardée KPI_ACCUEIL_TTL secondes dans un fichier partagé par les
+# workers. Les routes d'écriture l'invalident pour tous (invalider_kpi_accueil) :
+# un jeton de génération, remplacé à chaque invalidation, écarte aussi un
+# calcul commencé avant l'écriture et enregistré après.
+app.config.setdefault('KPI_ACCUEIL_TTL', 30)
+# Dossier fixe, partagé aussi avec les commandes flask qui modifient les
+# données ; une entrée restée d'un serveur précédent expire par KPI_ACCUEIL_TTL
+app.config.setdefault('CACHE_PARTAGE_DIR', os.path.join(app.instance_path, 'cache'))
+
+def calculer_kpi_accueil():
+    def compter(modele, *conditions):
+        return db.select(func.count(modele.id)).where(*conditions).scalar_subquery()
+
+    dernieres_ventes = db.select(Vente.id).order_by(Vente.date_vente.desc()).limit(5).subquery()
+    ligne = db.session.execute(db.select(
+        compter(Ecran).label('total_ecrans'),
+        db.select(func.coalesce(func.sum(VenteJournaliere.nombre_ventes), 0))
+            .scalar_subquery().label('total_ventes'),
+        compter(Client).label('total_clients'),
+        compter(Marque).label('total_marques'),
+        db.select(func.count()).select_from(dernieres_ventes).scalar_subquery().label('dernieres_ventes'),
+        # Parcourt l'index partiel ix_ecran_en_alerte
+        compter(Ecran, Ecran.quantite <= Ecran.seuil_alerte).label('ecrans_faible_stock')
+    )).one()
+    return {cle: int(valeur) for cle, valeur in ligne._mapping.items()}
+
+def chemins_kpi_accueil():
+    dossier = app.config['CACHE_PARTAGE_DIR']
+    return os.path.join(dossier, 'kpi_accueil.json'), os.path.join(dossier, 'kpi_accueil.generation')
+
+def ecrire_atomiquement(chemin, contenu):
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    temporaire = f'{chemin}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporaire, 'w') as f:
+        f.write(contenu)
+    os.replace(temporaire, chemin)
+
+def invalider_kpi_accueil():
+    """À appeler après un commit qui change un indicateur de l'accueil (tous les workers)."""
+    _, generation = chemins_kpi_accueil()
+    ecrire_atomiquement(generation, os.urandom(8).hex())
+
+def kpi_accueil():
+    cache, chemin_generation = chemins_kpi_accueil()
+    try:
+        with open(chemin_generation) as f:
+            generation = f.read()
+    except FileNotFoundError:
+        generation = ''
+    try:
+        with open(cache) as f:
+            entree = json.load(f)
+        if (entree['generation'] == generation
+                and time.time() - entree['calcule_le'] < app.config['KPI_ACCUEIL_TTL']):
+            metriques.incrementer('cache_succes_total', libelles(cache='kpi_accueil'))
+            return entree['kpi']
+    except (OSError, ValueError, KeyError):
+        pass
+    metriques.incrementer('cache_echecs_total', libelles(cache='kpi_accueil'))
+    kpi = calculer_kpi_accueil()
+    ecrire_atomiquement(cache, json.dumps({'generation': generation, 'calcule_le': time.time(), 'kpi': kpi}))
+    return kpi
+
 # Route pour les statistiques de la page d'accueil
 @app.route('/stats_accueil')
 def stats_accueil():
-    # Calculer les statistiques de base
-    total_ecrans = Ecran.query.count()
-    total_ventes = Vente.query.count()
-    total_clients = Client.query.count()
-    total_marques = Marque.query.count()
-    
-    # Récupérer les dernières ventes
-    dernieres_ventes = Vente.query.order_by(Vente.date_vente.desc()).limit(5).all()
-    
-    # Récupérer les écrans en stock faible
-    ecrans_faible_stock = Ecran.query.filter(Ecran.quantite <= Ecran.seuil_alerte).all()
-    
-    return jsonify({
-        'total_ecrans': total_ecrans,
-        'total_ventes': total_ventes,
-        'total_clients': total_clients,
-        'total_marques': total_marques,
-        'dernieres_ventes': len(dernieres_ventes),
-        'ecrans_faible_stock': len(ecrans_faible_stock)
-    })
+    return jsonify(kpi_accueil())
+
+# Instrumentation : latences par route, instructions SQL et rendus, exportés
+# au format Prometheus sur /metrics. Quelques compteurs en mémoire par
+# requête et par instruction SQL : assez léger pour rester actif en production.
+app.config.setdefault('METRIQUES_ACTIVES', os.environ.get('METRIQUES', '1') != '0')
+app.config.setdefault('SQL_LENTE_S', 0.25)          # seuil du journal des requêtes lentes
+app.config.setdefault('METRIQUES_ECRITURE_S', 5)    # intervalle d'écriture du fichier du worker
+# Un fichier par worker, additionnés par /metrics quel que soit le worker
+# interrogé. gunicorn vide le dossier au démarrage et à l'arrêt du serveur
+# (gunicorn.conf.py) : les compteurs repartent de zéro à chaque redémarrage.
+app.config.setdefault('METRIQUES_DIR', os.path.join(app.instance_path, 'metriques'))
+
+DUREES_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DUREES_SQL = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+DUREES_RENDU = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+NOMBRES_SQL = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+METRIQUES_AIDE = {
+    'http_requetes_total': ('counter', 'Requêtes HTTP par route, méthode et statut'),
+    'http_duree_secondes': ('histogram', 'Durée des requêtes HTTP par route, jusqu\'à la fin de la réponse'),
+    'sql_requetes_par_requete': ('histogram', 'Instructions SQL émises par requête HTTP'),
+    'sql_secondes_total': ('counter', 'Temps passé dans la base par route'),
+    'sql_duree_secondes': ('histogram', 'Durée des instructions SQL'),
+    'sql_lentes_total': ('counter', 'Instructions SQL plus longues que SQL_LENTE_S'),
+    'rendu_duree_secondes': ('histogram', 'Durée des rendus matplotlib, ReportLab et code-barres'),
+    'erreurs_prevision_total': ('counter', 'Échecs du chargement, de l\'entraînement ou de la prédiction'),
+    'cache_succes_total': ('counter', 'Lectures servies par un cache (mémoire ou fichier partagé)'),
+    'cache_echecs_total': ('counter', 'Lectures absentes d\'un cache (mémoire ou fichier partagé)'),
+}
+
+class Metriques:
+    """Compteurs et histogrammes d'un worker, sûrs entre threads.
+
+    Une série est identifiée par (nom, étiquettes), les étiquettes étant un
+    tuple de paires triées. Un histogramme garde le nombre d'observations par
+    borne (non cumulé, la dernière case pour +Inf) et leur somme.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.compteurs = {}
+        self.histogrammes = {}
+
+    def incrementer(self, nom, etiquettes=(), valeur=1):
+        cle = (nom, etiquettes)
+        with self._lock:
+            self.compteurs[cle] = self.compteurs.get(cle, 0) + valeur
+
+    def observer(self, nom, bornes, valeur, etiquettes=()):
+        cle = (nom, etiquettes)
+        rang = bisect.bisect_left(bornes, valeur)
+        with self._lock:
+            serie = self.histogrammes.get(cle)
+            if serie is None:
+                serie = self.histogrammes[cle] = [list(bornes), [0] * (len(bornes) + 1), 0.0]
+            serie[1][rang] += 1
+            serie[2] += valeur
+
+    def ajouter(self, autre):
+        """Additionne les séries d'un autre instantané (dict de instantane())."""
+        for nom, etiquettes, valeur in autre['compteurs']:
+            self.incrementer(nom, tuple(map(tuple, etiquettes)), valeur)
+        for nom, etiquettes, bornes, comptes, somme in autre['histogrammes']:
+            cle = (nom, tuple(map(tuple, etiquettes)))
+            with self._lock:
+                serie = self.histogrammes.setdefault(cle, [bornes, [0] * len(comptes), 0.0])
+                serie[1] = [a + b for a, b in zip(serie[1], comptes)]
+                serie[2] += somme
+
+    def instantane(self):
+        with self._lock:
+            return {
+                'compteurs': [[n, e, v] for (n, e), v in self.compteurs.items()],
+                'histogrammes': [[n, e, b, list(c), s] for (n, e), (b, c, s) in self.histogrammes.items()],
+            }
+
+metriques = Metriques()
+_metriques_ecriture = {'pid': None}
+_metriques_ecriture_lock = threading.Lock()
+
+def libelles(**valeurs):
+    return tuple(sorted((k, str(v)) for k, v in valeurs.items()))
+
+@contextlib.contextmanager
+def chronometre_rendu(moteur):
+    """Mesure un rendu (matplotlib, reportlab, barcode) dans rendu_duree_secondes."""
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        metriques.observer('rendu_duree_secondes', DUREES_RENDU, time.perf_counter() - debut,
+                           libelles(moteur=moteur))
+
+def instantane_worker():
+    """Séries du worker, avec les compteurs des caches en mémoire."""
+    donnees = metriques.instantane()
+    for nom, cache in (('barcode', cache_barcode), ('images_barcode', cache_images_barcode)):
+        donnees['compteurs'].append(['cache_succes_total', libelles(cache=nom), cache.hits])
+        donnees['compteurs'].append(['cache_echecs_total', libelles(cache=nom), cache.misses])
+    return donnees
+
+def ecrire_metriques():
+    """Écrit l'instantané du worker dans METRIQUES_DIR (un fichier par pid)."""
+    dossier = app.config['METRIQUES_DIR']
+    os.makedirs(dossier, exist_ok=True)
+    chemin = os.path.join(dossier, f'{os.getpid()}.json')
+    temporaire = f'{chemin}.{threading.get_ident()}.tmp'
+    with open(temporaire, 'w') as f:
+        json.dump(instantane_worker(), f)
+    os.replace(temporaire, chemin)
+
+def vider_metriques():
+    """Supprime les fichiers des workers, archive comprise (démarrage et arrêt du serveur)."""
+    shutil.rmtree(app.config['METRIQUES_DIR'], ignore_errors=True)
+
+def demarrer_ecriture_metriques():
+    """Thread du worker qui écrit son instantané toutes les METRIQUES_ECRITURE_S.
+
+    Démarré à la première requête de chaque processus : un thread lancé
+    dans le maître gunicorn ne survivrait pas au fork des workers.
+    """
+    with _metriques_ecriture_lock:
+        if _metriques_ecriture['pid'] == os.getpid():
+            return
+        _metriques_ecriture['pid'] = os.getpid()
+
+    def boucle():
+        while True:
+            time.sleep(app.config['METRIQUES_ECRITURE_S'])
+            try:
+                ecrire_metriques()
+            except OSError as e:
+                app.logger.warning(f"Écriture des métriques impossible: {e}")
+
+    threading.Thread(target=boucle, daemon=True).start()
+
+def processus_actif(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def lire_metriques_workers():
+    """Somme des fichiers de tous les workers.
+
+    Les fichiers des workers terminés (recyclés par max_requests) sont
+    additionnés une fois pour toutes dans archive.json : les compteurs
+    restent croissants et le dossier ne grossit pas.
+    """
+    dossier = app.config['METRIQUES_DIR']
+    total = Metriques()
+    archive = os.path.join(dossier, 'archive.json')
+    for fichier in sorted(os.listdir(dossier)):
+        if not fichier.endswith('.json') or fichier == 'archive.json':
+            continue
+        chemin = os.path.join(dossier, fichier)
+        try:
+            with open(chemin) as f:
+                donnees = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if fichier[:-5].isdigit() and not processus_actif(int(fichier[:-5])):
+            archivees = Metriques()
+            try:
+                with open(archive) as f:
+                    archivees.ajouter(json.load(f))
+            except (OSError, ValueError):
+                pass
+            archivees.ajouter(donnees)
+            temporaire = f'{archive}.{os.getpid()}.tmp'
+            with open(temporaire, 'w') as f:
+                json.dump(archivees.instantane(), f)
+            os.replace(temporaire, archive)
+            try:
+                os.remove(chemin)
+            except OSError:
+                pass
+            continue
+        total.ajouter(donnees)
+    try:
+        with open(archive) as f:
+            total.ajouter(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return total
+
+def format_prometheus(series):
+    """Texte d'exposition Prometheus (version 0.0.4)."""
+    def texte_libelles(etiquettes, **autres):
+        paires = list(etiquettes) + list(autres.items())
+        if not paires:
+            return ''
+        echapper = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{k}="{echapper(v)}"' for k, v in paires) + '}'
+
+    lignes = []
+    for nom, (type_, aide) in METRIQUES_AIDE.items():
+        compteurs = sorted((e, v) for (n, e), v in series.compteurs.items() if n == nom)
+        histogrammes = sorted((e, h) for (n, e), h in series.histogrammes.items() if n == nom)
+        if not compteurs and not histogrammes:
+            continue
+        lignes.append(f'# HELP {nom} {aide}')
+        lignes.append(f'# TYPE {nom} {type_}')
+        for etiq, valeur in compteurs:
+            lignes.append(f'{nom}{texte_libelles(etiq)} {valeur}')
+        for etiq, (bornes, comptes, somme) in histogrammes:
+            cumul = 0
+            for borne, compte in zip(bornes, comptes):
+                cumul += compte
+                lignes.append(f'{nom}_bucket{texte_libelles(etiq, le=borne)} {cumul}')
+            cumul += comptes[-1]
+            lignes.append(f'{nom}_bucket{texte_libelles(etiq, le="+Inf")} {cumul}')
+            lignes.append(f'{nom}_sum{texte_libelles(etiq)} {somme}')
+            lignes.append(f'{nom}_count{texte_libelles(etiq)} {cumul}')
+    return '\n'.join(lignes) + '\n'
+
+def debut_mesure():
+    g.metriques_debut = time.perf_counter()
+    g.sql_requetes = 0
+    g.sql_secondes = 0.0
+
+def noter_statut(reponse):
+    g.metriques_statut = reponse.status_code
+    return reponse
+
+def fin_mesure(exception):
+    debut = g.pop('metriques_debut', None)
+    if debut is None:
+        return
+    route = request.endpoint or 'inconnue'
+    statut = g.pop('metriques_statut', 500)
+    metriques.incrementer('http_requetes_total', libelles(route=route, methode=request.method, statut=statut))
+    metriques.observer('http_duree_secondes', DUREES_HTTP, time.perf_counter() - debut, libelles(route=route))
+    metriques.observer('sql_requetes_par_requete', NOMBRES_SQL, g.sql_requetes, libelles(route=route))
+    metriques.incrementer('sql_secondes_total', libelles(route=route), g.sql_secondes)
+    demarrer_ecriture_metriques()
+
+def debut_sql(connexion, curseur, instruction, parametres, contexte, executemany):
+    if contexte is not None:
+        contexte._metriques_debut = time.perf_counter()
+
+def fin_sql(connexion, curseur, instruction, parametres, contexte, executemany):
+    debut = getattr(contexte, '_metriques_debut', None)
+    if debut is None:
+        return
+    duree = time.perf_counter() - debut
+    metriques.observer('sql_duree_secondes', DUREES_SQL, duree)
+    en_requete = has_request_context() and 'metriques_debut' in g
+    if en_requete:
+        g.sql_requetes += 1
+        g.sql_secondes += duree
+    if duree >= app.config['SQL_LENTE_S']:
+        metriques.incrementer('sql_lentes_total')
+        app.logger.warning('Requête SQL lente (%.3f s, route %s) : %s', duree,
+                           request.endpoint if en_requete else '-', ' '.join(instruction.split())[:500])
+
+def installer_metriques(app):
+    """Branche les mesures sur les requêtes et sur le moteur (appelée par create_app)."""
+    app.before_request(debut_mesure)
+    app.after_request(noter_statut)
+    app.teardown_request(fin_mesure)
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', debut_sql)
+        event.listen(db.engine, 'after_cursor_execute', fin_sql)
+
+@app.route('/metrics')
+def metrics():
+    if not app.config['METRIQUES_ACTIVES']:
+        abort(404)
+    ecrire_metriques()
+    return app.response_class(format_prometheus(lire_metriques_workers()),
+                              content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Alertes de stock faible : flux poussé (SSE) et vérification conditionnelle
+# Chaque onglet ouvert garde un flux /flux_alertes ; les routes qui modifient
+# le stock réveillent les flux du worker, les autres workers voient la
+# nouvelle version à leur relecture suivante (une requête par worker et par
+# ALERTES_RELECTURE_S, quel que soit le nombre d'onglets)
+app.config.setdefault('ALERTES_RELECTURE_S', 5)
+app.config.setdefault('ALERTES_FLUX_DUREE', 300)     # le navigateur se reconnecte ensuite
+app.config.setdefault('ALERTES_FLUX_BATTEMENT', 25)  # commentaire SSE contre les coupures de proxy
+# Chaque flux occupe un thread du worker (voir threads dans gunicorn.conf.py) ;
+# au-delà, le navigateur revient à /verifier_alertes avec If-None-Match
+app.config.setdefault('ALERTES_FLUX_MAX', int(os.environ.get('ALERTES_FLUX_MAX', 4)))
+
+_alertes = {'version': None, 'lu_le': 0.0, 'flux': 0}
+_alertes_condition = threading.Condition()
+
+def version_alertes():
+    """Empreinte des écrans en alerte (id, quantité, seuil), relue au plus toutes les ALERTES_RELECTURE_S.
+
+    La requête ne parcourt que l'index partiel ix_ecran_en_alerte et rend sa
+    connexion aussitôt : un flux ouvert ne garde pas de transaction.
+    """
+    with _alertes_condition:
+        if (_alertes['version'] is not None
+                and time.monotonic() - _alertes['lu_le'] < app.config['ALERTES_RELECTURE_S']):
+            return _alertes['version']
+    with db.engine.connect() as connexion:
+        lignes = connexion.execute(
+            db.select(Ecran.id, Ecran.quantite, Ecran.seuil_alerte)
+            .where(Ecran.quantite <= Ecran.seuil_alerte).order_by(Ecran.id)
+        ).all()
+    version = hashlib.sha1(repr([tuple(l) for l in lignes]).encode()).hexdigest()[:16]
+    with _alertes_condition:
+        _alertes['version'] = version
+        _alertes['lu_le'] = time.monotonic()
+    return version
+
+def signaler_changement_stock():
+    """À appeler après un commit qui touche quantités ou seuils : réveille les flux du
+    worker et invalide les indicateurs de l'accueil (écrans, ventes, stock faible)."""
+    with _alertes_condition:
+        _alertes['version'] = None
+        _alertes_condition.notify_all()
+    invalider_kpi_accueil()
+
+def donnees_alertes():
+    ecrans_alerte = Ecran.query.filter(Ecran.quantite <= Ecran.seuil_alerte).all()
+    # Seuils suggérés par la dernière prévision enregistrée ; la quantité à
+    # commander est recalculée sur le stock actuel
+    suggestions = suggestions_reappro() if ecrans_alerte else {}
+    return {
+        'alertes': len(ecrans_alerte) > 0,
+        'ecrans': [{
+            'id': e.id,
+            'nom': e.nom,
+            'quantite': e.quantite,
+            'seuil': e.seuil_alerte,
+            'seuil_suggere': int(suggestions[e.id]['seuil_suggere']) if e.id in suggestions else None,
+            'a_commander': max(math.ceil(suggestions[e.id]['stock_cible'] - e.quantite), 0) if e.id in suggestions else None
+        } for e in ecrans_alerte]
+    }
 
 # Vérifier les seuils d'alerte
 @app.route('/verifier_alertes')
 def verifier_alertes():
-    ecrans_alerte = Ecran.query.filter(Ecran.quantite <= Ecran.seuil_alerte).all()
-    return jsonify({
-        'alertes': len(ecrans_alerte) > 0,
-        'ecrans': [{'id': e.id, 'nom': e.nom, 'quantite': e.quantite, 'seuil': e.seuil_alerte} for e in ecrans_alerte]
-    })
+    # 304 sans rien recalculer tant que les écrans en alerte n'ont pas changé
+    version = version_alertes()
+    if request.if_none_match.contains(version):
+        reponse = app.response_class(status=304)
+    else:
+        reponse = jsonify(donnees_alertes())
+    reponse.set_etag(version)
+    reponse.cache_control.no_cache = True
+    return reponse
+
+@app.route('/flux_alertes')
+def flux_alertes():
+    """Server-Sent Events : un évènement 'alertes' à chaque changement de version."""
+    with _alertes_condition:
+        if _alertes['flux'] >= app.config['ALERTES_FLUX_MAX']:
+            abort(503)
+        _alertes['flux'] += 1
+    # Après une reconnexion, rien n'est renvoyé si la version n'a pas changé
+    derniere = request.headers.get('Last-Event-ID')
+
+    def evenements(derniere):
+        yield f"retry: {app.config['ALERTES_RELECTURE_S'] * 1000}\n\n"
+        fin = time.monotonic() + app.config['ALERTES_FLUX_DUREE']
+        dernier_envoi = time.monotonic()
+        while time.monotonic() < fin:
+            version = version_alertes()
+            if version != derniere:
+                donnees = json.dumps(donnees_alertes())
+                # Pas de session (ni de transaction) gardée entre deux évènements
+                db.session.remove()
+                derniere = version
+                dernier_envoi = time.monotonic()
+                yield f"id: {version}\nevent: alertes\ndata: {donnees}\n\n"
+            elif time.monotonic() - dernier_envoi >= app.config['ALERTES_FLUX_BATTEMENT']:
+                dernier_envoi = time.monotonic()
+                yield ": battement\n\n"
+            with _alertes_condition:
+                _alertes_condition.wait(timeout=app.config['ALERTES_RELECTURE_S'])
+
+    def liberer():
+        with _alertes_condition:
+            _alertes['flux'] -= 1
+
+    reponse = app.response_class(
+        stream_with_context(evenements(derniere)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Appelé par le serveur à la fin de la réponse, y compris si le client se déconnecte
+    reponse.call_on_close(liberer)
+    return reponse
 
 # Créer les tables de la base de données
+# Révision Alembic qui correspond au schéma des bases créées par db.create_all,
+# et ses tables : celles des révisions suivantes sont créées par leur migration
+REVISION_INITIALE = '0001'
+TABLES_INITIALES = ('marque', 'ecran', 'client', 'facture', 'vente', 'historique', 'vente_journaliere')
+
+def tables_initiales():
+    return [db.metadata.tables[nom] for nom in TABLES_INITIALES]
+
+def creer_index_manquants():
+    """Crée les index déclarés sur des tables existantes (create_all ne le fait pas)."""
+    for table in tables_initiales():
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def ajouter_colonnes_manquantes():
+    """Ajoute les colonnes nullables déclarées mais absentes d'une table existante.
+
+    create_all ne modifie pas les tables existantes : une base créée avant
+    l'ajout de Vente.facture_id reçoit ainsi la colonne au démarrage.
+    """
+    inspecteur = inspect(db.engine)
+    with db.engine.begin() as connexion:
+        for table in tables_initiales():
+            existantes = {c['name'] for c in inspecteur.get_columns(table.name)}
+            for colonne in table.columns:
+                if colonne.name in existantes or not colonne.nullable:
+                    continue
+                type_sql = colonne.type.compile(dialect=db.engine.dialect)
+                connexion.exec_driver_sql(
+                    f'ALTER TABLE {table.name} ADD COLUMN {colonne.name} {type_sql}'
+                )
+
 def create_tables():
+    """Met la base au schéma courant par les migrations Alembic (migrations/).
+
+    Une base créée avant les migrations (par db.create_all) est d'abord
+    complétée comme auparavant puis marquée à la révision initiale ; les
+    révisions suivantes s'appliquent ensuite comme sur une base neuve.
+    """
+    from flask_migrate import upgrade, stamp
+
     with app.app_context():
-        db.create_all()
+        inspecteur = inspect(db.engine)
+        if inspecteur.has_table('ecran') and not inspecteur.has_table('alembic_version'):
+            db.metadata.create_all(bind=db.engine, tables=tables_initiales())
+            ajouter_colonnes_manquantes()
+            creer_index_manquants()
+            stamp(revision=REVISION_INITIALE)
+        upgrade()
+        installer_recherche()
+        installer_journal_catalogue()
+
+# Fabrique de l'application
+def url_base_de_donnees():
+    # إعدادات قاعدة البيانات
+    # استخدام قاعدة بيانات PostgreSQL على Render أو SQLite محلياً
+    database_url = os.environ.get('DATABASE_URL')
+    if database_url and database_url.startswith("postgres://"):
+        # تعديل رابط PostgreSQL ليتوافق مع SQLAlchemy
+        database_url = database_url.replace("postgres://", "postgresql://", 1)
+    return database_url or 'sqlite:///stock.db'
+
+# Pool de connexions (PostgreSQL) : par worker gunicorn, à dimensionner sur
+# son nombre de threads ; pre-ping et recyclage écartent les connexions
+# coupées par le serveur ou un proxy après un temps d'inactivité
+app.config.setdefault('BASE_POOL_TAILLE', int(os.environ.get('DB_POOL_SIZE', 5)))
+app.config.setdefault('BASE_POOL_DEBORDEMENT', int(os.environ.get('DB_MAX_OVERFLOW', 5)))
+app.config.setdefault('BASE_POOL_PRE_PING', True)
+app.config.setdefault('BASE_POOL_RECYCLAGE', 1800)  # secondes
+# SQLite : WAL pour que les lectures (alertes, recherche) ne bloquent pas les
+# ventes et inversement ; un écrivain qui trouve la base verrouillée attend
+# busy_timeout ms au lieu d'échouer. Appliqués à chaque nouvelle connexion.
+app.config.setdefault('SQLITE_PRAGMAS', {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',      # sûr en WAL : seul le dernier commit peut être perdu en cas de coupure
+    'busy_timeout': 10000,
+    'mmap_size': 256 * 1024 * 1024,
+})
+
+def options_moteur(uri):
+    """Options du moteur SQLAlchemy pour cette base (pool hors SQLite)."""
+    if make_url(uri).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': app.config['BASE_POOL_TAILLE'],
+        'max_overflow': app.config['BASE_POOL_DEBORDEMENT'],
+        'pool_pre_ping': app.config['BASE_POOL_PRE_PING'],
+        'pool_recycle': app.config['BASE_POOL_RECYCLAGE'],
+    }
+
+def appliquer_pragmas_sqlite(connexion_dbapi, enregistrement):
+    curseur = connexion_dbapi.cursor()
+    for nom, valeur in app.config['SQLITE_PRAGMAS'].items():
+        curseur.execute(f'PRAGMA {nom}={valeur}')
+    curseur.close()
+
+def create_app(config=None):
+    """Configure l'application et lie la base ; ne lance ni serveur ni create_all.
+
+    Appelée par les points d'entrée (wsgi.py pour gunicorn, init_db.py,
+    `python app.py`) ; les appels suivants retournent la même application.
+    """
+    if 'sqlalchemy' not in app.extensions:
+        app.config.setdefault('SQLALCHEMY_DATABASE_URI', url_base_de_donnees())
+        app.config.update(config or {})
+        # Caches dimensionnés d'après la configuration finale
+        cache_barcode.taille_max = app.config['BARCODE_CACHE_TAILLE']
+        cache_barcode.ttl = app.config['BARCODE_CACHE_TTL']
+        cache_images_barcode.taille_max = app.config['BARCODE_IMAGES_CACHE_TAILLE']
+        # Les options explicites de SQLALCHEMY_ENGINE_OPTIONS restent prioritaires
+        options = options_moteur(app.config['SQLALCHEMY_DATABASE_URI'])
+        options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+        db.init_app(app)
+        with app.app_context():
+            if db.engine.dialect.name == 'sqlite':
+                event.listen(db.engine, 'connect', appliquer_pragmas_sqlite)
+        if app.config['METRIQUES_ACTIVES']:
+            installer_metriques(app)
+        # render_as_batch : SQLite ne sait pas modifier une colonne sans recréer la table
+        migrate.init_app(app, db, directory=os.path.join(app.root_path, 'migrations'),
+                         render_as_batch=True)
+    return app
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Applique les migrations en attente et installe l'index de recherche."""
+    create_tables()
+    print("Base de données initialisée.")
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
+    # Serveur de développement uniquement ; en production : gunicorn -c gunicorn.conf.py wsgi:app
+    create_app()
+    create_tables()
     # تشغيل التطبيق على الخادم المحلي
     app.run(debug=True)
-else:
-    # عند النشر على Render
-    with app.app_context():
-        db.create_all()
-    # تشغيل التطبيق على المنفذ المحدد بواسطة Render
-    port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,166 @@
+"""Banc de concurrence lectures/écritures : réglages de la base avant et après.
+
+Des processus lecteurs interrogent /verifier_alertes et /historique (le
+sondage de chaque page ouverte) pendant que des processus vendeurs
+enregistrent des ventes, comme plusieurs workers gunicorn. Chaque scénario
+tourne sur une base neuve ; on relève le débit, les latences et les erreurs
+(base verrouillée) des deux côtés.
+
+Scénarios :
+  avant  : réglages par défaut du pilote (journal rollback, pool sans pre-ping)
+  apres  : SQLITE_PRAGMAS (WAL, synchronous=NORMAL, busy_timeout, mmap) et
+           options de pool BASE_POOL_* de l'application
+
+    python bench_concurrence.py
+    python bench_concurrence.py --lecteurs 6 --vendeurs 3 --duree 10 --json resultats.json
+    python bench_concurrence.py --base postgresql://localhost/stock_test
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+SCENARIOS = {
+    'avant': {
+        'SQLITE_PRAGMAS': {},
+        # Valeurs par défaut de SQLAlchemy (ignorées par SQLite)
+        'POOL': {'pool_size': 5, 'max_overflow': 10, 'pool_pre_ping': False, 'pool_recycle': -1},
+    },
+    'apres': {},
+}
+
+
+def configuration(scenario, base):
+    """Configuration passée à create_app pour ce scénario."""
+    reglages = dict(SCENARIOS[scenario])
+    pool = reglages.pop('POOL', None)
+    config = {'SQLALCHEMY_DATABASE_URI': base, **reglages}
+    if pool and not base.startswith('sqlite'):
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = pool
+    return config
+
+
+def preparer(config, ecrans=50, ventes=5000):
+    """Écrans au stock illimité en pratique, un client et un historique de ventes."""
+    from sqlalchemy import insert
+    from datetime import datetime, timedelta
+    from app import create_app, create_tables, db, Marque, Ecran, Client, Vente
+
+    app = create_app(config)
+    create_tables()
+    with app.app_context():
+        prefixe = uuid.uuid4().hex[:8]
+        marque = Marque(nom=f'Bench {prefixe}')
+        client = Client(nom='Bench', prenom='Concurrence')
+        db.session.add_all([marque, client])
+        db.session.flush()
+        ids = db.session.scalars(insert(Ecran).returning(Ecran.id), [{
+            'barcode': f'BENCH-{prefixe}-{i}', 'nom': f'Écran {i}', 'prix_achat': 1.0,
+            'prix_vente': 2.0, 'quantite': 10 ** 6, 'seuil_alerte': 0, 'marque_id': marque.id
+        } for i in range(ecrans)]).all()
+        maintenant = datetime.utcnow()
+        db.session.execute(insert(Vente), [{
+            'date_vente': maintenant - timedelta(minutes=i), 'quantite': 1, 'prix_unitaire': 2.0,
+            'ecran_id': ids[i % len(ids)], 'client_id': client.id
+        } for i in range(ventes)])
+        db.session.commit()
+        return ids, client.id
+
+
+def travailler(role, config, ecrans_ids, client_id, debut, fin):
+    """Processus lecteur ou vendeur : requêtes en boucle entre debut et fin."""
+    from app import create_app
+
+    app = create_app(config)
+    aleatoire = random.Random()
+    latences, erreurs = [], 0
+    with app.test_client() as client:
+        while time.time() < debut:
+            time.sleep(0.01)
+        while time.time() < fin:
+            t = time.perf_counter()
+            if role == 'lecteur':
+                url = '/verifier_alertes' if aleatoire.random() < 0.5 else '/historique'
+                ok = client.get(url).status_code == 200
+            else:
+                reponse = client.post('/effectuer_vente', data={
+                    'ecran_id': aleatoire.choice(ecrans_ids), 'client_id': client_id, 'quantite': 1
+                })
+                ok = reponse.status_code == 302 and '/facture/' in reponse.headers.get('Location', '')
+            if ok:
+                latences.append(time.perf_counter() - t)
+            else:
+                erreurs += 1
+    return role, latences, erreurs
+
+
+def centile(valeurs, p):
+    if not valeurs:
+        return float('nan')
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(p / 100 * len(valeurs)))]
+
+
+def executer(scenario, base, lecteurs, vendeurs, duree):
+    config = configuration(scenario, base)
+    contexte = multiprocessing.get_context('spawn')
+    # Chaque processus configure sa propre application (create_app n'agit qu'une fois)
+    with contexte.Pool(1) as pool:
+        ecrans_ids, client_id = pool.apply(preparer, (config,))
+    # Démarrage commun, une fois tous les processus importés
+    debut = time.time() + 3
+    taches = [(role, config, ecrans_ids, client_id, debut, debut + duree)
+              for role in ['lecteur'] * lecteurs + ['vendeur'] * vendeurs]
+    with contexte.Pool(len(taches)) as pool:
+        resultats = pool.starmap(travailler, taches)
+
+    bilan = {}
+    for role in ('lecteur', 'vendeur'):
+        latences = [l for r, ls, _ in resultats if r == role for l in ls]
+        bilan[role] = {
+            'requetes_s': len(latences) / duree,
+            'p50_ms': statistics.median(latences) * 1000 if latences else float('nan'),
+            'p95_ms': centile(latences, 95) * 1000,
+            'p99_ms': centile(latences, 99) * 1000,
+            'erreurs': sum(e for r, _, e in resultats if r == role),
+        }
+    return bilan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lecteurs', type=int, default=4, help='processus qui lisent')
+    parser.add_argument('--vendeurs', type=int, default=2, help='processus qui vendent')
+    parser.add_argument('--duree', type=float, default=8, help='durée de chaque scénario (s)')
+    parser.add_argument('--base', help='URL d\'une base de test (par défaut : SQLite neuve par scénario)')
+    parser.add_argument('--json', help='fichier où écrire les résultats')
+    args = parser.parse_args()
+
+    resultats = {}
+    with tempfile.TemporaryDirectory() as dossier:
+        for scenario in SCENARIOS:
+            base = args.base or 'sqlite:///' + os.path.join(dossier, f'{scenario}.db')
+            resultats[scenario] = executer(scenario, base, args.lecteurs, args.vendeurs, args.duree)
+
+    print(f"{args.lecteurs} lecteurs + {args.vendeurs} vendeurs, {args.duree:g}s par scénario")
+    print(f"{'scénario':10}{'rôle':10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'erreurs':>9}")
+    for scenario, bilan in resultats.items():
+        for role, m in bilan.items():
+            print(f"{scenario:10}{role:10}{m['requetes_s']:9.1f}{m['p50_ms']:9.1f}"
+                  f"{m['p95_ms']:9.1f}{m['p99_ms']:9.1f}{m['erreurs']:9d}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(resultats, f, indent=2)
+    if any(m['erreurs'] for m in resultats['apres'].values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
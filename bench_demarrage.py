@@ -0,0 +1,121 @@
+"""Mesure du démarrage d'un worker : temps d'import de app.py et mémoire (RSS).
+
+Chaque mesure tourne dans un processus Python neuf, comme un worker gunicorn
+qui démarre ou est recyclé. On relève le temps d'import, la mémoire résidente
+et les bibliothèques lourdes déjà chargées, puis le coût de la première
+requête qui en a besoin (statistiques, facture PDF, code-barres). Les alertes de stock,
+demandées par chaque page, ne doivent charger aucune de ces bibliothèques.
+
+    python bench_demarrage.py
+    python bench_demarrage.py --repetitions 5 --json resultats.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+LOURDES = ('pandas', 'numpy', 'sklearn', 'matplotlib', 'reportlab', 'barcode', 'PIL', 'seaborn')
+
+ENFANT = r'''
+import json, os, resource, sys, time
+
+def rss_mo():
+    # VmRSS courant (Linux) ; à défaut, le pic ru_maxrss
+    try:
+        with open('/proc/self/status') as f:
+            for ligne in f:
+                if ligne.startswith('VmRSS:'):
+                    return int(ligne.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+LOURDES = %(lourdes)r
+mesures = {'rss_initial_mo': rss_mo()}
+debut = time.perf_counter()
+import app
+app.create_app()
+mesures['import_s'] = time.perf_counter() - debut
+mesures['rss_apres_import_mo'] = rss_mo()
+mesures['modules_charges'] = [m for m in LOURDES if m in sys.modules]
+
+# Fichiers générés (modèle, graphiques, factures) dans le dossier temporaire
+dossier = os.environ['BENCH_DOSSIER']
+app.app.config['MODELE_VENTES_PATH'] = os.path.join(dossier, 'modele.pkl')
+for cle in ('GRAPHIQUES_CACHE_DIR', 'FACTURES_CACHE_DIR'):
+    app.app.config[cle] = os.path.join(dossier, cle.lower())
+app.create_tables()
+with app.app.app_context():
+    if app.Marque.query.count() == 0:
+        marque = app.Marque(nom='Bench')
+        app.db.session.add(marque)
+        app.db.session.flush()
+        app.db.session.add(app.Ecran(barcode='BENCH-1', nom='Bench', prix_achat=1, prix_vente=2,
+                                     quantite=100, marque_id=marque.id))
+        app.db.session.add(app.Ecran(barcode='BENCH-2', nom='Bench alerte', prix_achat=1, prix_vente=2,
+                                     quantite=1, seuil_alerte=5, marque_id=marque.id))
+        app.db.session.add(app.Client(nom='Bench', prenom='Test'))
+        app.db.session.commit()
+
+client = app.app.test_client()
+client.post('/effectuer_vente', data={'ecran_id': 1, 'client_id': 1, 'quantite': 1})
+debut = time.perf_counter()
+reponse = client.get('/verifier_alertes')
+mesures['premiere_alertes_s'] = time.perf_counter() - debut
+mesures['statut_alertes'] = reponse.status_code
+mesures['modules_charges_alertes'] = [m for m in LOURDES if m in sys.modules]
+for nom, url in [('accueil', '/'), ('statistiques', '/statistiques'),
+                 ('graphique', '/graphiques/ventes_mois.png'), ('facture_pdf', '/generer_facture_pdf/1'),
+                 ('barcode', '/generer_barcode/BENCH-1')]:
+    debut = time.perf_counter()
+    reponse = client.get(url)
+    mesures[f'premiere_{nom}_s'] = time.perf_counter() - debut
+    mesures[f'statut_{nom}'] = reponse.status_code
+mesures['rss_final_mo'] = rss_mo()
+print(json.dumps(mesures))
+'''
+
+
+def mesurer(dossier):
+    """Lance une mesure dans un processus neuf et retourne son dict de résultats."""
+    environnement = dict(os.environ)
+    environnement['DATABASE_URL'] = 'sqlite:///' + os.path.join(dossier, 'bench.db')
+    environnement['BENCH_DOSSIER'] = dossier
+    resultat = subprocess.run(
+        [sys.executable, '-c', ENFANT % {'lourdes': LOURDES}],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=environnement, capture_output=True, text=True, check=True
+    )
+    return json.loads(resultat.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repetitions', type=int, default=3, help='nombre de processus mesurés')
+    parser.add_argument('--json', help='fichier où écrire les résultats bruts et les médianes')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        series = [mesurer(dossier) for _ in range(args.repetitions)]
+
+    medianes = {cle: statistics.median(s[cle] for s in series)
+                for cle, valeur in series[0].items() if isinstance(valeur, float)}
+    print(f"Import de app.py: {medianes['import_s'] * 1000:.0f} ms, "
+          f"RSS après import: {medianes['rss_apres_import_mo']:.1f} Mo")
+    print(f"Bibliothèques lourdes chargées à l'import: {', '.join(series[0]['modules_charges']) or 'aucune'}")
+    print(f"Bibliothèques lourdes chargées après /verifier_alertes: "
+          f"{', '.join(series[0]['modules_charges_alertes']) or 'aucune'}")
+    for nom in ('alertes', 'accueil', 'statistiques', 'graphique', 'facture_pdf', 'barcode'):
+        print(f"Première requête {nom}: {medianes[f'premiere_{nom}_s'] * 1000:.0f} ms")
+    print(f"RSS après les premières requêtes: {medianes['rss_final_mo']:.1f} Mo")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'mesures': series, 'medianes': medianes}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
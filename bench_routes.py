@@ -0,0 +1,254 @@
+"""Banc des routes principales : latence, requêtes SQL et mémoire, en JSON.
+
+Appelle les vraies routes avec le client de test Flask sur une base remplie
+par generer_donnees.py : une base SQLite existante est copiée (les ventes du
+banc ne la modifient pas), sinon une base temporaire est générée. Pour chaque
+route : première requête (à froid), puis latences p50/p95/max sur
+`--repetitions` appels, nombre d'instructions SQL par requête, taille de la
+réponse et pic de mémoire allouée (tracemalloc) pendant une requête.
+
+Le JSON produit (--json) sert de référence : --comparer signale les routes
+plus lentes que la référence au-delà de --tolerance, ou qui émettent plus
+d'instructions SQL, et termine alors avec le code 1.
+
+    python bench_routes.py --json bench.json
+    python bench_routes.py --base sqlite:////tmp/grand.db --json apres.json --comparer avant.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+
+def ventes_de_test(aleatoire, contexte):
+    return 'POST', '/effectuer_vente', {
+        'ecran_id': aleatoire.choice(contexte['ecrans_en_stock']),
+        'client_id': aleatoire.choice(contexte['clients']), 'quantite': 1,
+    }
+
+# (nom, fonction(aleatoire, contexte) -> (méthode, url, données du formulaire))
+ROUTES = [
+    ('statistiques', lambda a, c: ('GET', '/statistiques', None)),
+    ('historique', lambda a, c: ('GET', '/historique', None)),
+    ('historique_ecran', lambda a, c: ('GET', f"/historique?ecran_id={a.choice(c['ecrans'])}", None)),
+    ('ecrans', lambda a, c: ('GET', '/ecrans', None)),
+    ('ecrans_page_100', lambda a, c: ('GET', '/ecrans?page=100', None)),
+    ('recherche_ecran_barcode', lambda a, c: ('GET', f"/recherche_ecran_barcode?barcode={a.choice(c['barcodes'])}", None)),
+    ('effectuer_vente', ventes_de_test),
+    ('verifier_alertes', lambda a, c: ('GET', '/verifier_alertes', None)),
+    ('stats_accueil', lambda a, c: ('GET', '/stats_accueil', None)),
+    ('vente', lambda a, c: ('GET', '/vente', None)),
+    ('catalogue_complet', lambda a, c: ('GET', '/catalogue', None)),
+    # Sondage d'une caisse synchronisée avant le banc : écrans modifiés par ses ventes
+    ('catalogue_delta', lambda a, c: ('GET', f"/catalogue?depuis={c['revision_catalogue']}", None)),
+    ('inventaire_fin_de_mois', lambda a, c: ('GET', f"/inventaire?au={a.choice(c['fins_de_mois'])}", None)),
+]
+
+
+def fins_de_mois(nombre):
+    """Derniers jours (AAAA-MM-JJ) des `nombre` mois précédant le mois en cours."""
+    fins, premier = [], datetime.now().replace(day=1)
+    for _ in range(nombre):
+        fin = premier - timedelta(days=1)
+        fins.append(fin.strftime('%Y-%m-%d'))
+        premier = fin.replace(day=1)
+    return fins
+
+
+def rss_max_mo():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def commit_courant():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def centile(valeurs, p):
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(p / 100 * len(valeurs)))]
+
+
+def mesurer_route(client, compteur, construire, aleatoire, contexte, repetitions):
+    def appeler():
+        methode, url, donnees = construire(aleatoire, contexte)
+        compteur['n'] = 0
+        debut = time.perf_counter()
+        reponse = client.open(url, method=methode, data=donnees)
+        taille = len(reponse.get_data())
+        duree = time.perf_counter() - debut
+        reponse.close()
+        return duree, compteur['n'], reponse.status_code, taille
+
+    premiere, _, statut, taille = appeler()
+    durees, requetes = [], []
+    for _ in range(repetitions):
+        duree, n, statut, taille = appeler()
+        durees.append(duree)
+        requetes.append(n)
+
+    tracemalloc.start()
+    appeler()
+    _, pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'statut': statut,
+        'premiere_ms': premiere * 1000,
+        'p50_ms': statistics.median(durees) * 1000,
+        'p95_ms': centile(durees, 95) * 1000,
+        'max_ms': max(durees) * 1000,
+        'requetes_sql': statistics.median(requetes),
+        'taille_ko': taille / 1024,
+        'pic_memoire_mo': pic / 1024 / 1024,
+        'rss_max_mo': rss_max_mo(),
+    }
+
+
+def comparer(resultats, reference, tolerance):
+    """Affiche l'écart à la référence ; retourne les routes en régression."""
+    regressions = []
+    print(f"\nComparaison avec {reference.get('commit') or 'la référence'} (tolérance x{tolerance:g}):")
+    if reference.get('volumes') != resultats['volumes']:
+        print(f"  Attention: volumes différents de la référence ({reference.get('volumes')})")
+    for nom, mesure in resultats['routes'].items():
+        avant = reference['routes'].get(nom)
+        if not avant:
+            continue
+        ratio = mesure['p50_ms'] / avant['p50_ms'] if avant['p50_ms'] else float('inf')
+        plus_de_sql = mesure['requetes_sql'] > avant['requetes_sql']
+        regression = ratio > tolerance or plus_de_sql
+        if regression:
+            regressions.append(nom)
+        print(f"  {'RÉGRESSION' if regression else 'ok        '} {nom:26} p50 x{ratio:.2f}"
+              f"  SQL {avant['requetes_sql']:g} -> {mesure['requetes_sql']:g}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base', help='base remplie par generer_donnees.py (SQLite copiée ; sinon base générée)')
+    parser.add_argument('--ecrans', type=int, default=5000, help='volume de la base générée')
+    parser.add_argument('--ventes', type=int, default=100000, help='volume de la base générée')
+    parser.add_argument('--repetitions', type=int, default=30)
+    parser.add_argument('--routes', help='noms séparés par des virgules (par défaut : toutes)')
+    parser.add_argument('--graine', type=int, default=42)
+    parser.add_argument('--json', help='fichier de résultats')
+    parser.add_argument('--comparer', help='résultats de référence (JSON d\'un run précédent)')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='ratio p50 toléré face à la référence')
+    args = parser.parse_args()
+
+    routes = ROUTES
+    if args.routes:
+        demandees = args.routes.split(',')
+        routes = [r for r in ROUTES if r[0] in demandees]
+
+    dossier = tempfile.mkdtemp(prefix='bench-routes-')
+    try:
+        base = args.base
+        if base and base.startswith('sqlite:///'):
+            # API de sauvegarde SQLite : copie cohérente, journal WAL compris
+            copie = os.path.join(dossier, 'bench.db')
+            source, cible = sqlite3.connect(base[len('sqlite:///'):]), sqlite3.connect(copie)
+            source.backup(cible)
+            source.close()
+            cible.close()
+            base = 'sqlite:///' + copie
+        generer = base is None
+        if generer:
+            base = 'sqlite:///' + os.path.join(dossier, 'bench.db')
+
+        import app as app_module
+        import generer_donnees
+        from sqlalchemy import event, func
+
+        # Mesures faites ici : l'instrumentation de l'application resterait dans les temps
+        app = app_module.create_app({
+            'SQLALCHEMY_DATABASE_URI': base,
+            'METRIQUES_ACTIVES': False,
+            'MODELE_VENTES_PATH': os.path.join(dossier, 'modele.pkl'),
+            'GRAPHIQUES_CACHE_DIR': os.path.join(dossier, 'graphiques'),
+            'FACTURES_CACHE_DIR': os.path.join(dossier, 'factures'),
+        })
+        app_module.create_tables()
+        with app.app_context():
+            db = app_module.db
+            if generer:
+                generer_donnees.generer(app_module, ecrans=args.ecrans, ventes=args.ventes,
+                                        clients=max(args.ecrans // 4, 10), mouvements=args.ventes // 2,
+                                        graine=args.graine)
+            # Modèle entraîné d'avance : /statistiques ne lance pas d'entraînement en arrière-plan
+            app_module.entrainer_modele_ventes(force=True)
+
+            Ecran, Client, Vente, Historique = app_module.Ecran, app_module.Client, app_module.Vente, app_module.Historique
+            volumes = {nom: db.session.query(func.count(modele.id)).scalar()
+                       for nom, modele in (('ecrans', Ecran), ('clients', Client),
+                                           ('ventes', Vente), ('mouvements', Historique))}
+            aleatoire = random.Random(args.graine)
+            ecrans = db.session.execute(db.select(Ecran.id, Ecran.barcode, Ecran.quantite)).all()
+            contexte = {
+                'ecrans': [e.id for e in ecrans],
+                'barcodes': [e.barcode for e in ecrans],
+                'ecrans_en_stock': [e.id for e in ecrans if e.quantite > 2 * args.repetitions] or [ecrans[0].id],
+                'clients': db.session.scalars(db.select(Client.id).limit(1000)).all(),
+                'fins_de_mois': fins_de_mois(12),
+                'revision_catalogue': db.session.scalar(
+                    db.select(func.coalesce(func.max(app_module.CatalogueJournal.revision), 0))),
+            }
+            db.session.remove()
+
+        compteur = {'n': 0}
+
+        def compter(*_):
+            compteur['n'] += 1
+
+        with app.app_context():
+            event.listen(app_module.db.engine, 'before_cursor_execute', compter)
+        client = app.test_client()
+        resultats = {
+            'commit': commit_courant(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'base': base.split(':', 1)[0],
+            'volumes': volumes,
+            'repetitions': args.repetitions,
+            'routes': {},
+        }
+        print(f"Base: {', '.join(f'{v} {k}' for k, v in volumes.items())}")
+        print(f"{'route':26}{'statut':>7}{'1re ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'SQL':>6}{'pic Mo':>8}{'Ko':>9}")
+        for nom, construire in routes:
+            mesure = mesurer_route(client, compteur, construire, aleatoire, contexte, args.repetitions)
+            resultats['routes'][nom] = mesure
+            print(f"{nom:26}{mesure['statut']:7d}{mesure['premiere_ms']:9.1f}{mesure['p50_ms']:9.1f}"
+                  f"{mesure['p95_ms']:9.1f}{mesure['max_ms']:9.1f}{mesure['requetes_sql']:6g}"
+                  f"{mesure['pic_memoire_mo']:8.1f}{mesure['taille_ko']:9.1f}")
+        resultats['rss_max_mo'] = rss_max_mo()
+        print(f"RSS maximal du processus: {resultats['rss_max_mo']:.0f} Mo")
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(resultats, f, indent=2)
+    if args.comparer:
+        with open(args.comparer) as f:
+            if comparer(resultats, json.load(f), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
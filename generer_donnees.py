@@ -0,0 +1,168 @@
+"""Générateur de données synthétiques : marques, écrans, clients, ventes, mouvements.
+
+Remplit une base vide (créée par les migrations) avec des volumes réalistes,
+insérés par lots sans passer par l'ORM : 100 000 écrans et 5 millions de
+ventes se chargent en quelques minutes. Les ventes se concentrent sur une
+partie du catalogue (loi de Zipf) et couvrent les `--jours` derniers jours ;
+environ un écran sur dix est sous son seuil d'alerte. Même graine, mêmes
+données (décalées à la date du jour).
+
+    python generer_donnees.py --base sqlite:////tmp/synthetique.db
+    python generer_donnees.py --base sqlite:////tmp/grand.db --ecrans 100000 --ventes 5000000
+"""
+import argparse
+import itertools
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+MARQUES = ['Samsung', 'iPhone', 'Huawei', 'Xiaomi', 'OPPO', 'Vivo', 'Realme', 'Nokia', 'Motorola',
+           'OnePlus', 'Honor', 'Tecno', 'Infinix', 'Itel', 'Google', 'Sony', 'LG', 'ZTE', 'Alcatel', 'Lenovo']
+GAMMES = ['A', 'S', 'Note', 'Pro', 'Lite', 'Max', 'Plus', 'Neo', 'Edge', 'Y', 'X', 'C']
+FINITIONS = ['LCD', 'OLED', 'Incell', 'Original', 'Avec châssis', 'Sans châssis']
+NOMS = ['Ben Ali', 'Trabelsi', 'Khaled', 'Jebali', 'Mansour', 'Gharbi', 'Hammami', 'Bouzid', 'Chaabane', 'Sassi']
+PRENOMS = ['Mohamed', 'Sonia', 'Amine', 'Yasmine', 'Karim', 'Ines', 'Walid', 'Salma', 'Nizar', 'Rim']
+
+
+def par_lots(lignes, taille):
+    lignes = iter(lignes)
+    while lot := list(itertools.islice(lignes, taille)):
+        yield lot
+
+
+def inserer(db, table, lignes, taille_lot, libelle, total):
+    """Insère les lignes par lots, une transaction par lot ; affiche le débit."""
+    debut = time.perf_counter()
+    inserees = 0
+    for lot in par_lots(lignes, taille_lot):
+        with db.engine.begin() as connexion:
+            connexion.execute(table.insert(), lot)
+        inserees += len(lot)
+        if inserees % (taille_lot * 20) < taille_lot or inserees == total:
+            duree = time.perf_counter() - debut
+            print(f"  {libelle}: {inserees}/{total} ({inserees / max(duree, 1e-9):,.0f} lignes/s)", flush=True)
+    return inserees
+
+
+def generer(app_module, marques=20, ecrans=20000, clients=5000, ventes=500000, mouvements=200000,
+            jours=730, graine=42, taille_lot=20000):
+    """Remplit la base de l'application courante (contexte d'application requis).
+
+    Retourne les volumes insérés. Lève ValueError si la base contient déjà
+    des écrans : les codes-barres générés entreraient en collision.
+    """
+    db = app_module.db
+    Marque, Ecran, Client, Vente, Historique = (app_module.Marque, app_module.Ecran, app_module.Client,
+                                                app_module.Vente, app_module.Historique)
+    if db.session.query(Ecran.id).first() is not None:
+        raise ValueError("La base contient déjà des écrans : utiliser une base vide.")
+
+    aleatoire = random.Random(graine)
+    fin = datetime.utcnow().replace(microsecond=0)
+    debut = fin - timedelta(days=jours)
+    secondes = (fin - debut).total_seconds()
+    debut_generation = time.perf_counter()
+
+    noms_marques = [MARQUES[i] if i < len(MARQUES) else f'Marque {i + 1}' for i in range(marques)]
+    inserer(db, Marque.__table__, ({'nom': nom} for nom in noms_marques), taille_lot, 'marques', marques)
+    marques_ids = db.session.scalars(db.select(Marque.id).order_by(Marque.id)).all()
+
+    def ecran(i):
+        prix_achat = round(aleatoire.uniform(10, 300), 1)
+        return {
+            'barcode': f'SYN{i:08d}',
+            'nom': f"{aleatoire.choice(GAMMES)}{aleatoire.randint(1, 99)} {aleatoire.choice(FINITIONS)}",
+            'prix_achat': prix_achat,
+            'prix_vente': round(prix_achat * aleatoire.uniform(1.2, 1.8), 1),
+            # Un écran sur dix sous le seuil d'alerte
+            'quantite': aleatoire.randint(0, 5) if aleatoire.random() < 0.1 else aleatoire.randint(6, 80),
+            'seuil_alerte': 5,
+            'marque_id': marques_ids[i % len(marques_ids)],
+        }
+    inserer(db, Ecran.__table__, (ecran(i) for i in range(ecrans)), taille_lot, 'écrans', ecrans)
+    catalogue = db.session.execute(db.select(Ecran.id, Ecran.prix_vente).order_by(Ecran.id)).all()
+
+    inserer(db, Client.__table__, ({
+        'nom': aleatoire.choice(NOMS), 'prenom': aleatoire.choice(PRENOMS),
+        'telephone': f'{aleatoire.randint(20000000, 99999999)}', 'email': f'client{i}@example.com',
+    } for i in range(clients)), taille_lot, 'clients', clients)
+    clients_ids = db.session.scalars(db.select(Client.id).order_by(Client.id)).all()
+
+    # Popularité des écrans : loi de Zipf (quelques modèles font l'essentiel des ventes)
+    poids = list(itertools.accumulate(1 / (rang + 1) ** 1.1 for rang in range(len(catalogue))))
+    ordre = list(range(len(catalogue)))
+    aleatoire.shuffle(ordre)
+
+    def ventes_chronologiques():
+        # Dates croissantes sans tout trier en mémoire : un pas régulier et une gigue
+        pas = secondes / max(ventes, 1)
+        for lot in par_lots(range(ventes), taille_lot):
+            choisis = aleatoire.choices(ordre, cum_weights=poids, k=len(lot))
+            for i, rang in zip(lot, choisis):
+                ecran_id, prix_vente = catalogue[rang]
+                yield {
+                    'date_vente': debut + timedelta(seconds=(i + aleatoire.random()) * pas),
+                    'quantite': 1 if aleatoire.random() < 0.85 else aleatoire.randint(2, 4),
+                    'prix_unitaire': prix_vente,
+                    'ecran_id': ecran_id,
+                    'client_id': aleatoire.choice(clients_ids),
+                }
+    inserer(db, Vente.__table__, ventes_chronologiques(), taille_lot, 'ventes', ventes)
+
+    def mouvements_chronologiques():
+        pas = secondes / max(mouvements, 1)
+        for i in range(mouvements):
+            yield {
+                'date_operation': debut + timedelta(seconds=(i + aleatoire.random()) * pas),
+                'type_operation': 'ajout' if aleatoire.random() < 0.3 else 'retrait',
+                'quantite': aleatoire.randint(1, 20),
+                'ecran_id': catalogue[aleatoire.randrange(len(catalogue))][0],
+            }
+    inserer(db, Historique.__table__, mouvements_chronologiques(), taille_lot, 'mouvements', mouvements)
+
+    print("  cumuls journaliers...", flush=True)
+    cumuls = app_module.reconstruire_cumuls_journaliers()
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as connexion:
+            connexion.exec_driver_sql('ANALYZE')
+
+    volumes = {'marques': marques, 'ecrans': ecrans, 'clients': clients, 'ventes': ventes,
+               'mouvements': mouvements, 'cumuls_journaliers': cumuls}
+    print(f"Données générées en {time.perf_counter() - debut_generation:.1f}s: "
+          + ', '.join(f'{v} {k}' for k, v in volumes.items()))
+    return volumes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base', default=os.environ.get('DATABASE_URL'),
+                        help='URL de la base à remplir (vide ; par défaut DATABASE_URL)')
+    parser.add_argument('--marques', type=int, default=20)
+    parser.add_argument('--ecrans', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=5000)
+    parser.add_argument('--ventes', type=int, default=500000)
+    parser.add_argument('--mouvements', type=int, default=200000, help='lignes d\'historique de stock')
+    parser.add_argument('--jours', type=int, default=730, help='période couverte, jusqu\'à aujourd\'hui')
+    parser.add_argument('--graine', type=int, default=42)
+    parser.add_argument('--lot', type=int, default=20000, help='lignes par insertion')
+    args = parser.parse_args()
+    if not args.base:
+        parser.error('préciser --base (ou DATABASE_URL) : jamais la base de production par défaut')
+
+    import app as app_module
+
+    # Sans instrumentation : chaque lot dépasserait le seuil du journal des requêtes lentes
+    app = app_module.create_app({'SQLALCHEMY_DATABASE_URI': args.base, 'METRIQUES_ACTIVES': False})
+    app_module.create_tables()
+    with app.app_context():
+        try:
+            generer(app_module, marques=args.marques, ecrans=args.ecrans, clients=args.clients,
+                    ventes=args.ventes, mouvements=args.mouvements, jours=args.jours,
+                    graine=args.graine, taille_lot=args.lot)
+        except ValueError as e:
+            parser.exit(1, f"{e}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Configuration gunicorn : gunicorn -c gunicorn.conf.py wsgi:app
+
+Les valeurs par défaut visent une petite instance Render ; chacune peut être
+remplacée par une variable d'environnement sans modifier ce fichier.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Processus : le travail CPU (PDF, graphiques, prévisions) ne se partage pas
+# entre threads à cause du GIL, d'où plusieurs workers. WEB_CONCURRENCY est
+# la variable fixée par Render selon la mémoire de l'instance.
+workers = int(os.environ.get('WEB_CONCURRENCY', min(2 * multiprocessing.cpu_count() + 1, 4)))
+
+# Threads par worker : la plupart des requêtes attendent la base de données,
+# et chaque onglet ouvert garde un flux d'alertes (au plus ALERTES_FLUX_MAX par
+# worker, voir app.py) ; les autres threads servent les requêtes ordinaires
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# app.py est importé une fois dans le maître puis partagé par fork (copy-on-write).
+# Il n'ouvre aucune connexion à l'import : rien à fermer après le fork.
+preload_app = True
+
+# Derrière le proxy de Render : garder les connexions ouvertes un peu plus
+# longtemps que lui évite des requêtes coupées
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75))
+
+# Les lots de factures et le premier graphique peuvent dépasser 30 s
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+
+# Recyclage périodique des workers contre la dérive mémoire ; le démarrage
+# d'un worker est rapide depuis le chargement paresseux des bibliothèques
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = 100
+
+# Fichiers de battement de cœur en mémoire (évite les blocages sur disque lent)
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    # Fichiers de métriques laissés par un serveur précédent : compteurs à zéro
+    from app import vider_metriques
+    vider_metriques()
+
+
+def on_exit(server):
+    from app import vider_metriques
+    vider_metriques()
+
+
+def worker_exit(server, worker):
+    # Dernier instantané des métriques avant l'arrêt ou le recyclage du worker
+    from app import ecrire_metriques
+    ecrire_metriques()
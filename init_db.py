@@ -1,10 +1,12 @@
 
-from app import app, db, Marque, Ecran, Client
+from app import create_app, create_tables, db, Marque, Ecran, Client, Vente, VenteJournaliere, reconstruire_cumuls_journaliers, entrainer_modele_ventes
 
-with app.app_context():
-    # Créer les tables
-    db.create_all()
+app = create_app()
+
+# Créer les tables, colonnes et index manquants et l'index de recherche
+create_tables()
 
+with app.app_context():
     # Ajouter des marques par défaut
     if Marque.query.count() == 0:
         marques = [
@@ -62,4 +64,13 @@ with app.app_context():
     else:
         print("Les clients existent déjà dans la base de données.")
 
+    # Remplir les cumuls journaliers à partir des ventes existantes
+    if VenteJournaliere.query.count() == 0 and Vente.query.count() > 0:
+        nombre = reconstruire_cumuls_journaliers()
+        print(f"{nombre} cumuls journaliers reconstruits à partir des ventes existantes!")
+
+    # Entraîner le modèle de prédiction si un nouveau mois complet est disponible
+    if entrainer_modele_ventes():
+        print("Modèle de prédiction des ventes entraîné!")
+
     print("Initialisation de la base de données terminée!")
@@ -0,0 +1,29 @@
+"""Index de la requête des alertes et des écrans par marque
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 18:55:10.214087
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # if_not_exists : une base mise à niveau depuis create_all peut déjà les avoir
+    op.create_index('ix_ecran_en_alerte', 'ecran', ['id'], unique=False, if_not_exists=True,
+                    sqlite_where=sa.text('quantite <= seuil_alerte'),
+                    postgresql_where=sa.text('quantite <= seuil_alerte'))
+    op.create_index('ix_ecran_marque', 'ecran', ['marque_id'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_ecran_marque', table_name='ecran')
+    op.drop_index('ix_ecran_en_alerte', table_name='ecran')
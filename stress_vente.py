@@ -0,0 +1,122 @@
+"""Test de charge concurrente de /effectuer_vente : aucune survente tolérée.
+
+Plusieurs processus (comme des workers gunicorn) vendent en parallèle un même
+écran jusqu'à épuisement du stock. À la fin, le nombre de ventes réussies doit
+être égal au stock initial et la quantité restante doit être exactement 0 ;
+chaque tentative doit avoir été vendue ou refusée, sans aucune erreur.
+
+Utilise la base de DATABASE_URL : à lancer sur une base de test, par exemple
+
+    DATABASE_URL=sqlite:////tmp/stress.db python stress_vente.py
+    DATABASE_URL=postgresql://localhost/stock_test python stress_vente.py
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+import uuid
+
+
+def preparer(stock):
+    """Crée un écran dédié avec `stock` unités et un client ; retourne leurs ids."""
+    from app import create_app, create_tables, db, Marque, Ecran, Client
+
+    app = create_app()
+    create_tables()
+    with app.app_context():
+        marque = Marque.query.filter_by(nom='Stress').first() or Marque(nom='Stress')
+        db.session.add(marque)
+        db.session.flush()
+        ecran = Ecran(barcode=f'STRESS-{uuid.uuid4().hex[:12]}', nom='Écran stress',
+                      prix_achat=1.0, prix_vente=2.0, quantite=stock, seuil_alerte=0,
+                      marque_id=marque.id)
+        client = Client(nom='Stress', prenom='Test')
+        db.session.add_all([ecran, client])
+        db.session.commit()
+        return ecran.id, client.id
+
+
+def vendre(arguments):
+    """Exécuté dans un processus séparé : `tentatives` ventes d'une unité."""
+    ecran_id, client_id, tentatives = arguments
+    from app import create_app
+
+    app = create_app()
+    resultats = {'reussies': 0, 'refusees': 0, 'erreurs': 0}
+    with app.test_client() as client:
+        for _ in range(tentatives):
+            reponse = client.post('/effectuer_vente', data={
+                'ecran_id': ecran_id, 'client_id': client_id, 'quantite': 1
+            })
+            if reponse.status_code == 302 and '/facture/' in reponse.headers.get('Location', ''):
+                resultats['reussies'] += 1
+            elif reponse.status_code == 302:
+                resultats['refusees'] += 1
+            else:
+                resultats['erreurs'] += 1
+    return resultats
+
+
+def verifier(ecran_id, stock, totaux, tentatives):
+    """Bilan de la base après la charge ; 'problemes' est vide si le test réussit."""
+    from sqlalchemy import func
+    from app import create_app, db, Ecran, Vente
+
+    app = create_app()
+    with app.app_context():
+        restant = db.session.get(Ecran, ecran_id).quantite
+        vendues = db.session.query(func.coalesce(func.sum(Vente.quantite), 0)) \
+            .filter(Vente.ecran_id == ecran_id).scalar()
+    problemes = []
+    if restant < 0 or vendues > stock or totaux['reussies'] != vendues:
+        problemes.append("survente détectée")
+    if totaux['erreurs']:
+        problemes.append(f"{totaux['erreurs']} requête(s) en erreur")
+    if totaux['reussies'] + totaux['refusees'] != tentatives:
+        problemes.append(f"{tentatives - totaux['reussies'] - totaux['refusees']} tentative(s) "
+                         f"ni vendue(s) ni refusée(s)")
+    if vendues + restant != stock:
+        problemes.append("stock restant différent du stock initial moins les ventes")
+    elif tentatives >= stock and restant != 0:
+        problemes.append(f"stock non épuisé ({restant} restant) malgré {tentatives} tentatives")
+    return {
+        'stock_initial': stock,
+        'quantite_restante': restant,
+        'unites_vendues': int(vendues),
+        'problemes': problemes
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processus', type=int, default=8, help='nombre de processus vendeurs')
+    parser.add_argument('--ventes', type=int, default=40, help='tentatives de vente par processus')
+    parser.add_argument('--stock', type=int, default=100, help='stock initial de l\'écran testé')
+    args = parser.parse_args()
+
+    ecran_id, client_id = preparer(args.stock)
+
+    debut = time.perf_counter()
+    contexte = multiprocessing.get_context('spawn')
+    with contexte.Pool(args.processus) as pool:
+        resultats = pool.map(vendre, [(ecran_id, client_id, args.ventes)] * args.processus)
+    duree = time.perf_counter() - debut
+
+    totaux = {cle: sum(r[cle] for r in resultats) for cle in ('reussies', 'refusees', 'erreurs')}
+    bilan = verifier(ecran_id, args.stock, totaux, args.processus * args.ventes)
+
+    print(f"{args.processus} processus x {args.ventes} tentatives en {duree:.2f}s")
+    print(f"Réussies: {totaux['reussies']}, refusées (stock insuffisant): {totaux['refusees']}, "
+          f"erreurs: {totaux['erreurs']}")
+    print(f"Stock initial: {bilan['stock_initial']}, unités vendues: {bilan['unites_vendues']}, "
+          f"restant: {bilan['quantite_restante']}")
+
+    if bilan['problemes']:
+        for probleme in bilan['problemes']:
+            print(f"ÉCHEC: {probleme}")
+        sys.exit(1)
+    print("OK: aucune survente, stock épuisé exactement, aucune erreur.")
+
+
+if __name__ == '__main__':
+    main()
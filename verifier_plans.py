@@ -0,0 +1,156 @@
+"""Test de régression des plans de requête : historique, statistiques, alertes et inventaire.
+
+Crée une base neuve par les migrations (create_tables), y insère un jeu de
+données, puis appelle les vraies routes avec le client de test. Chaque SELECT
+émis est rejoué sous EXPLAIN (EXPLAIN QUERY PLAN sur SQLite) avec les mêmes
+paramètres : le plan doit passer par l'index attendu et ne jamais parcourir
+entièrement les tables vente et historique. Code de sortie 1 en cas d'écart.
+
+    python verifier_plans.py
+    python verifier_plans.py --base postgresql://localhost/stock_test
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# (route, index qui doit apparaître dans au moins un plan de la requête)
+VERIFICATIONS = [
+    ('/historique', 'ix_vente_date_id'),
+    ('/historique', 'ix_historique_date_id'),
+    ('/historique?ecran_id=7', 'ix_vente_ecran_date'),
+    ('/historique?ecran_id=7', 'ix_historique_ecran_date'),
+    ('/historique?client_id=3', 'ix_vente_client_date'),
+    ('/historique?type_operation=retrait', 'ix_historique_type_date'),
+    ('/historique?du=2024-01-01&au=2024-01-31', 'ix_vente_date_id'),
+    ('/stats_accueil', 'ix_vente_date_id'),
+    ('/stats_accueil', 'ix_ecran_en_alerte'),
+    ('/verifier_alertes', 'ix_ecran_en_alerte'),
+    ('/inventaire?au=2024-06-30', 'ix_stock_instantane_date_ecran'),
+]
+
+# Tables qui grossissent avec l'activité : jamais de parcours complet
+TABLES_SURVEILLEES = ('vente', 'historique')
+
+
+def remplir(app_module, ecrans=200, ventes=5000):
+    """Jeu de données : quelques écrans en alerte, ventes et mouvements sur un an,
+    un instantané de stock au 31 mars."""
+    from sqlalchemy import insert
+
+    db = app_module.db
+    aleatoire = random.Random(42)
+    marques = [app_module.Marque(nom=f'Marque {i}') for i in range(5)]
+    clients = [app_module.Client(nom=f'Client {i}', prenom='Test') for i in range(50)]
+    db.session.add_all(marques + clients)
+    db.session.flush()
+    db.session.execute(insert(app_module.Ecran), [{
+        'barcode': f'PLAN-{i:05d}', 'nom': f'Écran {i}', 'prix_achat': 10.0, 'prix_vente': 15.0,
+        # un écran sur vingt sous son seuil d'alerte
+        'quantite': 2 if i % 20 == 0 else 50, 'seuil_alerte': 5,
+        'marque_id': marques[i % len(marques)].id
+    } for i in range(ecrans)])
+    debut = datetime(2024, 1, 1)
+    db.session.execute(insert(app_module.Vente), [{
+        'date_vente': debut + timedelta(minutes=aleatoire.randrange(525600)),
+        'quantite': 1, 'prix_unitaire': 15.0,
+        'ecran_id': aleatoire.randint(1, ecrans), 'client_id': aleatoire.choice(clients).id
+    } for _ in range(ventes)])
+    db.session.execute(insert(app_module.Historique), [{
+        'date_operation': debut + timedelta(minutes=aleatoire.randrange(525600)),
+        'type_operation': aleatoire.choice(('ajout', 'retrait')),
+        'quantite': 1, 'ecran_id': aleatoire.randint(1, ecrans)
+    } for _ in range(ventes)])
+    db.session.commit()
+    app_module.reconstruire_cumuls_journaliers()
+    app_module.creer_instantane_stock(datetime(2024, 3, 31))
+
+
+def expliquer(connexion, dialecte, instruction, parametres):
+    if dialecte == 'sqlite':
+        lignes = connexion.exec_driver_sql('EXPLAIN QUERY PLAN ' + instruction, parametres)
+        return '\n'.join(ligne[-1] for ligne in lignes)
+    lignes = connexion.exec_driver_sql('EXPLAIN ' + instruction, parametres)
+    return '\n'.join(ligne[0] for ligne in lignes)
+
+
+def parcours_complets(dialecte, plan):
+    """Tables surveillées lues entièrement (sans index) dans ce plan."""
+    if dialecte == 'sqlite':
+        motif = r'\bSCAN (\w+)(?! USING)'
+    else:
+        motif = r'Seq Scan on (\w+)'
+    return [t for t in re.findall(motif, plan) if t in TABLES_SURVEILLEES]
+
+
+def plans_de(client, db, url):
+    """Appelle url et retourne les plans des SELECT qu'elle a émis."""
+    from sqlalchemy import event
+
+    emises = []
+
+    def capturer(conn, cursor, instruction, parametres, context, executemany):
+        if instruction.lstrip().upper().startswith('SELECT'):
+            emises.append((instruction, parametres))
+
+    event.listen(db.engine, 'before_cursor_execute', capturer)
+    try:
+        reponse = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capturer)
+    if reponse.status_code != 200:
+        raise RuntimeError(f'{url}: statut {reponse.status_code}')
+
+    dialecte = db.engine.dialect.name
+    with db.engine.connect() as connexion:
+        if dialecte == 'postgresql':
+            # Petit jeu de données : sans cela le planificateur préfère Seq Scan
+            connexion.exec_driver_sql('SET enable_seqscan = off')
+        return [(instruction, expliquer(connexion, dialecte, instruction, parametres))
+                for instruction, parametres in emises]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base', help='URL d\'une base de test vide (par défaut : SQLite temporaire)')
+    parser.add_argument('--verbeux', action='store_true', help='affiche tous les plans')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        os.environ['DATABASE_URL'] = args.base or 'sqlite:///' + os.path.join(dossier, 'plans.db')
+        import app as app_module
+
+        app = app_module.create_app({'MODELE_VENTES_PATH': os.path.join(dossier, 'modele.pkl')})
+        app_module.create_tables()
+        echecs = 0
+        with app.app_context():
+            remplir(app_module)
+            dialecte = app_module.db.engine.dialect.name
+            client = app.test_client()
+            cache = {}
+            for url, index in VERIFICATIONS:
+                if url not in cache:
+                    cache[url] = plans_de(client, app_module.db, url)
+                plans = cache[url]
+                tout = '\n'.join(plan for _, plan in plans)
+                scans = sorted({t for _, plan in plans for t in parcours_complets(dialecte, plan)})
+                ok = index in tout and not scans
+                echecs += not ok
+                print(f"{'OK   ' if ok else 'ÉCHEC'} {url:45} {index}"
+                      + (f" (parcours complet de {', '.join(scans)})" if scans else ''))
+                if not ok or args.verbeux:
+                    for instruction, plan in plans:
+                        print('    ' + ' '.join(instruction.split())[:160])
+                        print('      ' + plan.replace('\n', '\n      '))
+
+    if echecs:
+        print(f"ÉCHEC: {echecs} plan(s) sans l'index attendu.")
+        sys.exit(1)
+    print("OK: toutes les requêtes passent par leurs index.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+"""Point d'entrée WSGI de production.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    flask --app wsgi init-db
+"""
+from app import create_app
+
+app = create_app()